@@ -2,25 +2,38 @@ from typing import Dict, Optional, List
 import time
 import google.generativeai as genai
 from config import Config
+from mentor_prefetch import SolutionPrefetcher
+from model_client import ModelClient
+from profiling import RunProfiler, profiled
 
 
 class AIMentor:
     """AI Mentor providing Socratic guidance, solution templates, and interactive chat"""
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, profiler: Optional[RunProfiler] = None,
+                 prefetcher: Optional[SolutionPrefetcher] = None):
         self.api_key = api_key or Config.GEMINI_API_KEY
         genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel("gemini-2.5-flash")
+        self.model = ModelClient(Config.TEXT_MODEL)
         self.conversation_history = []
+        if profiler is None and Config.PROFILE_SAMPLE_RATE > 0:
+            profiler = RunProfiler()
+        self.profiler = profiler
+        # Shared and injected by the app or service; each one spends its own call budget
+        self.prefetcher = prefetcher
 
     # --------------------------
     # Critical Thinking / Socratic Mode
     # --------------------------
+    @profiled('socratic_mode')
     def critical_thinking_mode(self, problem_description: str, context: Optional[str] = None) -> Dict:
         prompt = self._create_critical_thinking_prompt(problem_description, context)
         try:
-            result_text = self._generate_with_retry(prompt)
+            result_text = self._generate_with_retry(prompt, stage='socratic')
             parsed = self._parse_socratic_response(result_text)
+            # Solution mode on the same problem is the usual next click
+            if self.prefetcher is not None:
+                self.prefetcher.schedule(self, problem_description)
             return {
                 'success': True,
                 'mode': 'Critical Thinking',
@@ -37,15 +50,24 @@ class AIMentor:
     # --------------------------
     # Solution Mode
     # --------------------------
+    @profiled('solution_mode')
     def solution_mode(self, problem_description: str, template_type: str = 'auto', category: Optional[str] = None) -> Dict:
         # Determine template type automatically if needed
         if template_type == 'auto':
             template_type = self._determine_template_type(problem_description, category)
 
+        if self.prefetcher is not None:
+            prefetched = self.prefetcher.take(problem_description, template_type, category)
+            if prefetched is not None:
+                return prefetched
+        return self._generate_solution(problem_description, template_type, category)
+
+    def _generate_solution(self, problem_description: str, template_type: str,
+                           category: Optional[str] = None) -> Dict:
         prompt = self._create_solution_template_prompt(problem_description, template_type, category)
 
         try:
-            result_text = self._generate_with_retry(prompt)
+            result_text = self._generate_with_retry(prompt, stage='solution')
             parsed = self._parse_template_response(result_text, template_type)
             return {
                 'success': True,
@@ -63,18 +85,22 @@ class AIMentor:
     # --------------------------
     # Interactive Chat Mode
     # --------------------------
-    def interactive_mentoring(self, user_message: str, mode: str = 'critical_thinking') -> Dict:
-        self.conversation_history.append({'role': 'user', 'content': user_message})
-        prompt = self._create_interactive_prompt(user_message, mode)
+    @profiled('interactive_chat')
+    def interactive_mentoring(self, user_message: str, mode: str = 'critical_thinking',
+                              history: Optional[List[Dict]] = None) -> Dict:
+        # A caller-supplied history keeps this call stateless; it is copied, never mutated
+        conversation = self.conversation_history if history is None else list(history)
+        conversation.append({'role': 'user', 'content': user_message})
+        prompt = self._create_interactive_prompt(user_message, mode, conversation)
         try:
-            response_text = self._generate_with_retry(prompt)
-            self.conversation_history.append({'role': 'mentor', 'content': response_text})
+            response_text = self._generate_with_retry(prompt, stage='chat')
+            conversation.append({'role': 'mentor', 'content': response_text})
             return {
                 'success': True,
                 'mode': mode,
                 'user_message': user_message,
                 'mentor_response': response_text,
-                'conversation_length': len(self.conversation_history)
+                'conversation_length': len(conversation)
             }
         except Exception as e:
             return {'success': False, 'error': str(e), 'mode': mode}
@@ -88,11 +114,12 @@ class AIMentor:
     # --------------------------
     # Gemini API call with retries
     # --------------------------
-    def _generate_with_retry(self, prompt: str, max_retries: int = 3, wait_seconds: int = 2) -> str:
+    def _generate_with_retry(self, prompt: str, stage: Optional[str] = None,
+                             max_retries: int = 3, wait_seconds: int = 2) -> str:
         retries = 0
         while retries < max_retries:
             try:
-                response = self.model.generate_content(prompt)
+                response = self.model.generate_content(prompt, stage=stage)
                 return response.text
             except Exception as e:
                 if "429" in str(e):
@@ -119,9 +146,12 @@ class AIMentor:
         instruction += "\nInclude sections, implementation guide, and practical tips."
         return instruction
 
-    def _create_interactive_prompt(self, user_message: str, mode: str) -> str:
+    def _create_interactive_prompt(self, user_message: str, mode: str,
+                                   conversation: Optional[List[Dict]] = None) -> str:
+        if conversation is None:
+            conversation = self.conversation_history
         history_context = ""
-        for entry in self.conversation_history[-6:]:
+        for entry in conversation[-6:]:
             role = entry['role'].title()
             history_context += f"{role}: {entry['content']}\n"
         if mode == 'critical_thinking':
@@ -1,30 +1,154 @@
 import streamlit as st
 from PIL import Image
 import os
+import tempfile
 from ai_mentor import AIMentor
 from integrated_system import AILearningPlatform
+from result_cache import ResultCache
+from job_runner import JobRunner
+from results_store import ResultsStore
+from config import Config
+from connection_warmer import start_warmer
+from mentor_prefetch import SolutionPrefetcher
 
 # ------------ PAGE CONFIG ------------
 st.set_page_config(page_title="AI Learning Platform", layout="wide")
 
 # ------------ UTILS ------------
-platform = AILearningPlatform()
-mentor = AIMentor()
-
-def save_uploaded_image(uploaded_file):
-    temp_path = os.path.join("temp_uploaded_image.jpg")
-    with open(temp_path, "wb") as f:
+@st.cache_resource
+def get_platform():
+    results_store = ResultsStore() if Config.STORE_RESULTS else None
+    platform = AILearningPlatform(results_store=results_store)
+    # Open model connections in the background so the first visitor does not pay for them
+    start_warmer(platform)
+    return platform
+
+@st.cache_resource
+def get_result_cache():
+    # Shared by all sessions so identical uploads are analyzed once
+    return ResultCache()
+
+@st.cache_resource
+def get_job_runner():
+    # One bounded worker pool serves every session on this server
+    return JobRunner(get_platform(), result_cache=get_result_cache())
+
+@st.cache_resource
+def get_solution_prefetcher():
+    # Outlives reruns, so a Socratic answer's prefetch is there for the next click
+    return SolutionPrefetcher()
+
+platform = get_platform()
+mentor = AIMentor(prefetcher=get_solution_prefetcher() if Config.SOLUTION_PREFETCH else None)
+result_cache = get_result_cache()
+job_runner = get_job_runner()
+
+if "analysis_jobs" not in st.session_state:
+    st.session_state.analysis_jobs = []
+
+def save_uploaded_image(uploaded_file, image_key: str):
+    # Named by content hash; written aside and swapped in so no reader sees a partial file
+    os.makedirs("temp_uploads", exist_ok=True)
+    extension = os.path.splitext(uploaded_file.name)[1] or ".jpg"
+    temp_path = os.path.join("temp_uploads", image_key.split(":")[-1] + extension)
+    fd, staging_path = tempfile.mkstemp(dir="temp_uploads", suffix=extension)
+    with os.fdopen(fd, "wb") as f:
         f.write(uploaded_file.getbuffer())
+    os.replace(staging_path, temp_path)
     return temp_path
 
-def download_text(text: str, filename: str):
+def download_text(text: str, filename: str, key: str = None):
     st.download_button(
         label=f"Download {filename}",
         data=text,
         file_name=filename,
-        mime="text/plain"
+        mime="text/plain",
+        key=key
     )
 
+def render_vision_analysis(analysis: str):
+    st.markdown("**Vision Analysis:**")
+    st.write(analysis)
+
+def render_classification(classification_result):
+    st.success(f"Classified as: {classification_result.get('category', 'Unknown')}")
+    st.write(f"Confidence: {classification_result.get('confidence', 'Unknown')}")
+    st.write(f"Reasoning: {classification_result.get('reasoning', 'N/A')}")
+
+def render_mission(mission, summary: str, key: str):
+    st.markdown(f"**Mission Statement:** {mission.get('mission_statement', '')}")
+    st.markdown(f"**Summary:** {summary}")
+
+    download_text(mission.get('mission_statement', ''), "mission_statement.txt", key=f"{key}-mission")
+    download_text(summary, "problem_summary.txt", key=f"{key}-summary")
+
+def render_analysis_result(analysis_result, key: str):
+    if analysis_result.get('vision_analysis'):
+        render_vision_analysis(analysis_result['vision_analysis'])
+    render_classification(analysis_result['classification'])
+    render_mission(analysis_result['mission_statement'], analysis_result.get('summary', ''), key)
+
+def render_partial_events(events):
+    # Show each finished stage of a running image job
+    for event in events:
+        if event['stage'] == 'vision_detection' and event['success']:
+            render_vision_analysis(event['data']['analysis'])
+        elif event['stage'] == 'classification':
+            render_classification(event['data'])
+
+def submit_analysis(kind: str, key: str, label: str, payload):
+    entries = st.session_state.analysis_jobs
+    if key not in result_cache:
+        active = [entry for entry in entries if entry['job_id'] and job_runner.is_active(entry['job_id'])]
+        if len(active) >= Config.MAX_JOBS_PER_SESSION:
+            st.warning("Too many analyses in progress. Please wait for one to finish.")
+            return
+        if kind == "image":
+            # A running job already has this image on disk; rewriting it would race its reader
+            job_id = job_runner.active_job(key)
+            if job_id is None:
+                image_path = save_uploaded_image(payload, key)
+                job_id = job_runner.submit_image(image_path, key=key, delete_after=True)
+        else:
+            job_id = job_runner.submit_text(payload, key=key)
+    else:
+        job_id = None
+    # Re-analyzing the same content replaces its earlier entry
+    entries[:] = [entry for entry in entries if entry['key'] != key]
+    entries.insert(0, {'job_id': job_id, 'key': key, 'kind': kind, 'label': label})
+
+def render_analysis_jobs(polling: bool):
+    still_active = False
+    for index, entry in enumerate(st.session_state.analysis_jobs):
+        analysis_result = result_cache.get(entry['key'])
+        job = job_runner.get(entry['job_id']) if entry['job_id'] else None
+
+        if analysis_result:
+            status = "done"
+        elif job:
+            status = job['status']
+        else:
+            status = "expired"
+        still_active = still_active or status in JobRunner.ACTIVE_STATES
+
+        with st.expander(f"{entry['label']} — {status}", expanded=index == 0):
+            if analysis_result:
+                render_analysis_result(analysis_result, key=entry['key'])
+            elif status == "done":
+                # Job history outlives the result cache, so the job keeps its own copy
+                render_analysis_result(job['result'], key=entry['key'])
+            elif status == "expired":
+                st.info("This result is no longer available. Please run the analysis again.")
+            elif status == "failed":
+                st.error(f"Error: {job['result'].get('error', 'Analysis failed')}")
+            else:
+                render_partial_events(job['events'])
+                st.info("Analysis in progress..." if status == "running" else "Waiting for a free worker...")
+
+    # Stop polling once every job of this session has finished
+    if polling and not still_active:
+        st.rerun()
+
 # ------------- STYLES -------------
 st.markdown("""
 <style>
@@ -63,63 +187,35 @@ if section == "▼ Problem Analysis":
     if analysis_option == "Describe a Problem":
         st.subheader("Describe Your Problem")
         problem_text = st.text_area("Enter the problem:", height=150)
+        text_key = ResultCache.make_key(problem_text.strip().encode(), "text")
 
         if st.button("Analyze Problem"):
             if problem_text.strip() == "":
                 st.warning("Please enter a problem description.")
             else:
-                classification_result = platform.problem_classifier.classify_problem(problem_text)
-
-                if classification_result['success']:
-                    category = classification_result['category']
-                    confidence = classification_result['confidence']
-                    reasoning = classification_result['reasoning']
-                    full_response = classification_result['full_response']
-
-                    st.success(f"Classified as: {category}")
-                    st.write(f"Confidence: {confidence}")
-                    st.write(f"Reasoning: {reasoning}")
-
-                    mission = platform.mission_generator.generate_mission_statement(
-                        problem_text,
-                        context=f"Category: {category}"
-                    )
-
-                    st.markdown(f"**Mission Statement:** {mission.get('mission_statement', '')}")
-                    st.markdown(f"**Summary:** {platform._create_text_summary(problem_text, classification_result, mission)}")
-
-                    download_text(mission.get('mission_statement', ''), "mission_statement.txt")
-                    download_text(platform._create_text_summary(problem_text, classification_result, mission), "problem_summary.txt")
-                else:
-                    st.error(f"Error: {classification_result.get('error', 'Analysis failed')}")
+                label = problem_text.strip()[:60]
+                submit_analysis("text", text_key, label, problem_text)
 
     # ---------- UPLOAD IMAGE ----------
     elif analysis_option == "Upload Image":
         st.subheader("Upload an Image for Analysis")
-        uploaded_img = st.file_uploader("Choose an image", type=["jpg", "png", "jpeg"])
+        uploaded_img = st.file_uploader("Choose an image", type=sorted(Config.ALLOWED_EXTENSIONS))
 
         if uploaded_img:
-            img_path = save_uploaded_image(uploaded_img)
+            image_key = ResultCache.make_key(uploaded_img.getvalue(), "image")
             st.image(uploaded_img, caption="Uploaded Image", use_container_width=True)
 
             if st.button("Analyze Image"):
-                analysis_result = platform.process_image(img_path)
-
-                if analysis_result['success']:
-                    classification_result = analysis_result['classification']
-                    mission = analysis_result['mission_statement']
-
-                    st.success(f"Classified as: {classification_result.get('category', 'Unknown')}")
-                    st.write(f"Confidence: {classification_result.get('confidence', 'Unknown')}")
-                    st.write(f"Reasoning: {classification_result.get('reasoning', 'N/A')}")
-
-                    st.markdown(f"**Mission Statement:** {mission.get('mission_statement', '')}")
-                    st.markdown(f"**Summary:** {analysis_result.get('summary', '')}")
-
-                    download_text(mission.get('mission_statement', ''), "mission_statement.txt")
-                    download_text(analysis_result.get('summary', ''), "problem_summary.txt")
-                else:
-                    st.error(f"Error: {analysis_result.get('error', 'Analysis failed')}")
+                submit_analysis("image", image_key, uploaded_img.name, uploaded_img)
+
+    # ---------- YOUR ANALYSES ----------
+    if st.session_state.analysis_jobs:
+        st.markdown("<div class='section-header'>Your Analyses</div>", unsafe_allow_html=True)
+        polling = any(
+            entry['job_id'] and job_runner.is_active(entry['job_id'])
+            for entry in st.session_state.analysis_jobs
+        )
+        st.fragment(render_analysis_jobs, run_every=1.0 if polling else None)(polling)
 
 # =============================================
 #                 AI MENTOR SECTION
@@ -143,6 +239,7 @@ elif section == "▼ AI Mentor":
                 st.warning("Please type something.")
             else:
                 response = mentor.critical_thinking_mode(user_query)
+                st.session_state.last_mentor_query = user_query
                 if response['success']:
                     st.markdown("**GUIDING QUESTIONS:**")
                     st.write(f"{response.get('full_response', '')}")
@@ -156,7 +253,8 @@ elif section == "▼ AI Mentor":
     elif mentor_option == "Solution Mode":
         st.subheader("Solution Mode")
         st.write("Get direct, actionable answers.")
-        user_query = st.text_area("Ask your question:")
+        user_query = st.text_area("Ask your question:",
+                                  value=st.session_state.get("last_mentor_query", ""))
 
         template_type = st.selectbox(
             "select template type:",
@@ -9,11 +9,43 @@ class Config:
     
     # Google Gemini API Configuration
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+    # Optional comma-separated pool; model calls are spread across these keys
+    GEMINI_API_KEYS = [key.strip() for key in os.getenv('GEMINI_API_KEYS', '').split(',') if key.strip()]
+    GEMINI_API_KEY = GEMINI_API_KEY or (GEMINI_API_KEYS[0] if GEMINI_API_KEYS else None)
     
     # Model configurations
     VISION_MODEL = "gemini-2.5-flash"  # Gemini Vision model
     TEXT_MODEL = "gemini-2.5-flash"  # For NLP tasks
     
+    # Opt-in per-stage model routing: each stage tries its chain of tiers (or model names) in
+    # order, skipping models that are erroring or slower than the stage's latency target
+    MODEL_ROUTING = os.getenv('MODEL_ROUTING', 'false').lower() == 'true'
+    MODEL_TIERS = {
+        'lite': "gemini-2.5-flash-lite",
+        'standard': TEXT_MODEL,
+        'vision': VISION_MODEL,
+        'pro': "gemini-2.5-pro"
+    }
+    STAGE_ROUTES = {
+        'vision': ['vision', 'lite'],
+        'classify': ['lite', 'standard'],
+        'mission': ['standard', 'lite'],
+        'socratic': ['standard', 'lite'],
+        'solution': ['standard', 'lite'],
+        'chat': ['standard', 'lite']
+    }
+    STAGE_LATENCY_TARGETS = {  # Seconds
+        'vision': 12.0,
+        'classify': 3.0,
+        'mission': 8.0,
+        'socratic': 8.0,
+        'solution': 10.0,
+        'chat': 5.0
+    }
+    ROUTER_EWMA_ALPHA = 0.2  # Weight of the newest call in latency and error averages
+    ROUTER_MAX_ERROR_RATE = 0.3
+    ROUTER_PROBE_RATE = 0.05  # Share of calls sent to a fallback to keep its measurements fresh
+    
     # Problem categories
     CATEGORIES = ['Environment', 'Health', 'Education']
     
@@ -49,6 +81,95 @@ class Config:
     MAX_IMAGE_SIZE = 20 * 1024 * 1024  # 20MB
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
     
+    # Local quality check before any vision call: 'reject' skips the API, 'flag' only reports
+    QUALITY_GATE = os.getenv('QUALITY_GATE', 'reject')  # 'reject', 'flag' or 'off'
+    QUALITY_SAMPLE_SIDE = 512  # Checks run on a grayscale copy scaled to this size
+    QUALITY_MIN_SIDE = 128  # Pixels on the shorter side of the upload
+    QUALITY_MIN_SHARPNESS = 8.0  # Laplacian variance; a Gaussian blur of radius 4 scores ~10
+    QUALITY_MIN_BRIGHTNESS = 15  # Mean luminance, 0-255
+    QUALITY_MAX_BRIGHTNESS = 245
+    QUALITY_MAX_CLIPPED = 0.95  # Share of pixels crushed to black or blown to white
+    QUALITY_MIN_CONTRAST = 4.0  # Luminance standard deviation; below this the image is blank
+    
+    # Packed multi-image requests
+    IMAGE_TILE_TOKENS = 258  # Tokens billed per image tile
+    PACKED_TOKEN_BUDGET = 16 * 258  # Image tokens allowed in one packed request
+    PACKED_MAX_IMAGES = 8
+    
+    # Pipeline results memoized by the Streamlit app
+    RESULT_CACHE_SIZE = 64
+    
+    # Keyframe sampling for animated GIF/WebP uploads
+    KEYFRAME_MAX = 6
+    KEYFRAME_PACKED = True  # Send all keyframes in one request
+    KEYFRAME_SAMPLE_SIZE = 64  # Frames are compared as 64x64 grayscale
+    KEYFRAME_HISTOGRAM_THRESHOLD = 0.25  # Histogram distance (0-1) marking a scene change
+    KEYFRAME_PIXEL_THRESHOLD = 0.12  # Mean pixel difference (0-1) marking a scene change
+    
+    # Batch image preparation (decode, EXIF transpose, resize, re-encode)
+    PREPARE_MAX_SIDE = 1536  # Longest side sent to the model, in pixels
+    PREPARE_JPEG_QUALITY = 90
+    CPU_WORKERS = os.cpu_count() or 1
+    IO_WORKERS = 8
+    
+    # Background analysis jobs
+    JOB_WORKERS = 8  # Shared by all sessions
+    JOB_HISTORY_SIZE = 256
+    MAX_JOBS_PER_SESSION = 5
+    
+    # Pipeline execution
+    # Generate the mission while classification runs; a miss pays for a second mission call
+    SPECULATIVE_MISSION = os.getenv('SPECULATIVE_MISSION', 'false').lower() == 'true'
+    STAGE_CACHE_SIZE = 512  # Stage outputs cached by input hash
+    BATCH_MAX_IN_FLIGHT = 4  # Images running or awaiting the consumer in batch iterators
+    
+    # Per-key rate limiting for the API key pool
+    KEY_REQUESTS_PER_MINUTE = int(os.getenv('KEY_REQUESTS_PER_MINUTE', '15'))
+    KEY_FAILURE_THRESHOLD = 3  # Consecutive errors before a key is quarantined
+    KEY_QUARANTINE_SECONDS = 60
+    KEY_RATE_LIMIT_COOLDOWN = 20  # Seconds a key rests after a 429
+    
+    # Connection warm-up at startup and keepalive pings for idle channels
+    CONNECTION_WARMUP = os.getenv('CONNECTION_WARMUP', 'true').lower() == 'true'
+    KEEPALIVE_IDLE_SECONDS = 240  # Channels idle this long get a ping
+    CHANNEL_COLD_SECONDS = 300  # Calls after this much idle time are timed as cold
+    
+    # Background Solution-mode prefetch after a Socratic answer
+    SOLUTION_PREFETCH = os.getenv('SOLUTION_PREFETCH', 'false').lower() == 'true'
+    PREFETCH_TTL_SECONDS = 300
+    PREFETCH_BUDGET_PER_MINUTE = 10  # Prefetch calls allowed per minute
+    PREFETCH_MAX_ENTRIES = 32
+    PREFETCH_MAX_LIVE_CALLS = 8  # Skip prefetching while this many model calls are outstanding
+    
+    # Headless HTTP service
+    SERVICE_PORT = int(os.getenv('SERVICE_PORT', '8080'))
+    SERVICE_MAX_IN_FLIGHT = 64  # Requests admitted at once before answering 503
+    SERVICE_WORKERS = 32  # Threads running blocking pipeline calls
+    SERVICE_RETRY_AFTER = 2  # Seconds suggested to rejected clients
+    SERVICE_EVENT_BUFFER = 2  # Stage events queued for a streaming client before the worker waits
+    
+    # On-demand profiling (cProfile + tracemalloc) of sampled runs
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # 0 disables, 1 profiles every run
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+    PROFILE_TOP_N = 25
+    PROFILE_TRACEBACK_DEPTH = 1
+    
+    # Columnar history of pipeline results
+    STORE_RESULTS = os.getenv('STORE_RESULTS', 'false').lower() == 'true'
+    RESULTS_STORE_DIR = os.getenv('RESULTS_STORE_DIR', 'results_store')
+    RESULTS_FLUSH_ROWS = 500
+    RESULTS_FLUSH_SECONDS = 60
+    
+    # Local classification of vision analyses from their DETECTED ISSUES section
+    LOCAL_CLASSIFICATION = True  # Falls back to the model when the result is ambiguous
+    LOCAL_CLASSIFY_MIN_SHARE = 0.6  # Severity-weighted share the top domain needs
+    
+    # Token budgets for stage inputs built from the vision analysis
+    STAGE_INPUT_BUDGETS = {
+        'classification': 200,
+        'mission_generation': 160
+    }
+    
     @staticmethod
     def validate():
         """Validate that required configuration is present"""
@@ -0,0 +1,104 @@
+import threading
+from typing import Dict, List, Optional
+from config import Config
+from metrics import metrics
+from model_client import ModelClient, channel_idle_seconds
+
+
+class ConnectionWarmer:
+    """Opens model channels before the first user needs them and keeps idle ones from going cold"""
+
+    def __init__(self, clients: List[ModelClient], keepalive_idle: Optional[float] = None):
+        self.clients = clients
+        self.keepalive_idle = keepalive_idle or Config.KEEPALIVE_IDLE_SECONDS
+        self.warmup_latencies: Dict[str, float] = {}
+        self.warmed = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def for_components(cls, *components) -> 'ConnectionWarmer':
+        """Collects the model clients of platforms, mentors and pipeline components"""
+        clients = []
+        for component in components:
+            children = [getattr(component, name, None) for name in
+                        ('vision_detector', 'problem_classifier', 'mission_generator', 'mentor')]
+            for owner in [component] + [child for child in children if child is not None]:
+                client = getattr(owner, 'model', None)
+                if isinstance(client, ModelClient) and client not in clients:
+                    clients.append(client)
+        return cls(clients)
+
+    def start(self, keepalive: bool = True) -> 'ConnectionWarmer':
+        """Warms every channel on a background thread, then pings idle ones until stopped"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(keepalive,),
+                                            name='connection-warmer', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def warm_up(self) -> Dict[str, float]:
+        """Pings each distinct channel once; returns the cold latency per channel and model"""
+        for channel, client, model in self._channels():
+            label = f"{self._label(channel)}:{client.model_name}"
+            latency = self._ping(channel, client, model, 'model.warmup')
+            if latency is not None:
+                self.warmup_latencies[label] = latency
+        self.warmed.set()
+        return dict(self.warmup_latencies)
+
+    def keepalive(self):
+        """Pings channels that have been idle longer than the keepalive threshold"""
+        for channel, client, model in self._channels():
+            idle = channel_idle_seconds(channel)
+            if idle is not None and idle >= self.keepalive_idle:
+                self._ping(channel, client, model, 'model.keepalive')
+
+    def _run(self, keepalive: bool):
+        self.warm_up()
+        if not keepalive:
+            return
+        # Checking at a fraction of the threshold keeps a channel from overshooting it much
+        while not self._stop.wait(self.keepalive_idle / 4):
+            self.keepalive()
+
+    def _channels(self):
+        # Channels are shared across clients, so each is pinged through the first client using it
+        seen = set()
+        for client in self.clients:
+            for channel, model in client.channels():
+                if channel not in seen:
+                    seen.add(channel)
+                    yield channel, client, model
+
+    def _ping(self, channel: Optional[str], client: ModelClient, model, metric: str) -> Optional[float]:
+        try:
+            latency = client.ping(channel, model)
+        except Exception as e:
+            metrics.increment(f"{metric}.errors")
+            print(f"Connection ping failed for {self._label(channel)}: {e}")
+            return None
+        metrics.observe(metric, latency)
+        return latency
+
+    @staticmethod
+    def _label(channel: Optional[str]) -> str:
+        return 'default' if channel is None else f"...{channel[-4:]}"
+
+
+_warmer = None
+_warmer_lock = threading.Lock()
+
+
+def start_warmer(*components) -> Optional[ConnectionWarmer]:
+    """Starts the process-wide warmer once; later calls return the running one"""
+    global _warmer
+    if not Config.CONNECTION_WARMUP:
+        return None
+    with _warmer_lock:
+        if _warmer is None:
+            _warmer = ConnectionWarmer.for_components(*components).start()
+        return _warmer
@@ -0,0 +1,541 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, Optional
+import tornado.ioloop
+import tornado.web
+from tornado.iostream import StreamClosedError
+from ai_mentor import AIMentor
+from config import Config
+from connection_warmer import start_warmer
+from integrated_system import AILearningPlatform
+from key_pool import default_key_pool
+from mentor_prefetch import SolutionPrefetcher
+from model_router import default_router
+from metrics import metrics
+
+
+class MultipartStreamParser:
+    """Incrementally parses a multipart/form-data body, spooling file parts to disk"""
+
+    MAX_FIELD_SIZE = 64 * 1024
+    MAX_HEADER_SIZE = 16 * 1024
+
+    def __init__(self, boundary: bytes, upload_dir: Optional[str] = None):
+        self.delimiter = b'--' + boundary
+        self.part_end = b'\r\n' + self.delimiter
+        self.upload_dir = upload_dir
+        self.fields = {}
+        self.files = {}
+        self._buffer = bytearray()
+        self._state = 'preamble'
+        self._part = None
+
+    def feed(self, chunk: bytes):
+        self._buffer.extend(chunk)
+        while self._step():
+            pass
+
+    def finish(self):
+        if self._state != 'done':
+            self.cleanup()
+            raise ValueError("Multipart body ended before its closing boundary")
+
+    def cleanup(self):
+        if self._part and self._part.get('file'):
+            # A part cut off mid-body never reached self.files
+            self._part['file'].close()
+            os.remove(self._part['file'].name)
+            self._part = None
+        for upload in self.files.values():
+            if os.path.exists(upload['path']):
+                os.remove(upload['path'])
+
+    def _step(self) -> bool:
+        if self._state == 'preamble':
+            index = self._buffer.find(self.delimiter + b'\r\n')
+            if index == -1:
+                return False
+            del self._buffer[:index + len(self.delimiter) + 2]
+            self._state = 'headers'
+            return True
+
+        if self._state == 'headers':
+            index = self._buffer.find(b'\r\n\r\n')
+            if index == -1:
+                if len(self._buffer) > self.MAX_HEADER_SIZE:
+                    raise ValueError("Multipart part headers too large")
+                return False
+            headers = bytes(self._buffer[:index]).decode('utf-8', 'replace')
+            del self._buffer[:index + 4]
+            self._start_part(headers)
+            self._state = 'body'
+            return True
+
+        if self._state == 'body':
+            index = self._buffer.find(self.part_end)
+            if index == -1:
+                # Keep enough bytes back to catch a boundary split across chunks
+                safe = len(self._buffer) - len(self.part_end)
+                if safe > 0:
+                    self._write(self._buffer[:safe])
+                    del self._buffer[:safe]
+                return False
+            self._write(self._buffer[:index])
+            del self._buffer[:index + len(self.part_end)]
+            self._end_part()
+            self._state = 'boundary'
+            return True
+
+        if self._state == 'boundary':
+            if len(self._buffer) < 2:
+                return False
+            if self._buffer[:2] == b'--':
+                self._state = 'done'
+                self._buffer.clear()
+                return False
+            if self._buffer[:2] != b'\r\n':
+                raise ValueError("Malformed multipart boundary")
+            del self._buffer[:2]
+            self._state = 'headers'
+            return True
+
+        return False
+
+    def _start_part(self, headers: str):
+        disposition = re.search(r'content-disposition:[^\r\n]*', headers, re.IGNORECASE)
+        disposition = disposition.group(0) if disposition else ''
+        name = re.search(r'\bname="([^"]*)"', disposition)
+        filename = re.search(r'\bfilename="([^"]*)"', disposition)
+        content_type = re.search(r'content-type:\s*([^\r\n]+)', headers, re.IGNORECASE)
+
+        self._part = {'name': name.group(1) if name else '', 'size': 0}
+        if filename:
+            suffix = os.path.splitext(filename.group(1))[1].lower()
+            self._part['file'] = tempfile.NamedTemporaryFile(
+                dir=self.upload_dir, suffix=suffix, delete=False
+            )
+            self._part['filename'] = filename.group(1)
+            self._part['content_type'] = content_type.group(1).strip() if content_type else None
+        else:
+            self._part['value'] = bytearray()
+
+    def _write(self, data):
+        if not data:
+            return
+        self._part['size'] += len(data)
+        if 'file' in self._part:
+            self._part['file'].write(data)
+        else:
+            if self._part['size'] > self.MAX_FIELD_SIZE:
+                raise ValueError(f"Form field '{self._part['name']}' too large")
+            self._part['value'].extend(data)
+
+    def _end_part(self):
+        part, self._part = self._part, None
+        if 'file' in part:
+            part['file'].close()
+            self.files[part['name']] = {
+                'path': part['file'].name,
+                'filename': part['filename'],
+                'content_type': part['content_type'],
+                'size': part['size']
+            }
+        else:
+            self.fields[part['name']] = part['value'].decode('utf-8', 'replace')
+
+
+class AnalysisService:
+    """Shared state for the HTTP front-end: pipeline objects, worker pool and admission control"""
+
+    def __init__(self, platform: Optional[AILearningPlatform] = None,
+                 mentor: Optional[AIMentor] = None,
+                 max_in_flight: Optional[int] = None, workers: Optional[int] = None):
+        self.platform = platform or AILearningPlatform()
+        if mentor is None:
+            # One prefetcher for the service; the platform's own mentor never prefetches
+            mentor = AIMentor(prefetcher=SolutionPrefetcher() if Config.SOLUTION_PREFETCH else None)
+        self.mentor = mentor
+        self.max_in_flight = max_in_flight or Config.SERVICE_MAX_IN_FLIGHT
+        self.executor = ThreadPoolExecutor(max_workers=workers or Config.SERVICE_WORKERS,
+                                           thread_name_prefix='service')
+        self.in_flight = 0
+        self.warmer = None
+
+    def try_admit(self) -> bool:
+        # Runs on the event loop thread only, so no lock is needed
+        if self.in_flight >= self.max_in_flight:
+            metrics.increment('service.rejected')
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+    async def call(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: func(*args, **kwargs))
+
+    def shutdown(self):
+        if self.warmer is not None:
+            self.warmer.stop()
+        if self.mentor.prefetcher is not None:
+            self.mentor.prefetcher.shutdown()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def to_json(value) -> str:
+    # Result objects expose to_dict; anything else unknown (SDK objects) becomes text
+    return json.dumps(value, default=lambda obj: obj.to_dict() if hasattr(obj, 'to_dict') else str(obj))
+
+
+class BaseHandler(tornado.web.RequestHandler):
+
+    def initialize(self, service: AnalysisService):
+        self.service = service
+        self.admitted = False
+        self.working = False
+        self.connection_closed = False
+        self.started = time.perf_counter()
+
+    def admit(self) -> bool:
+        self.admitted = self.service.try_admit()
+        if not self.admitted:
+            self.set_header('Retry-After', str(Config.SERVICE_RETRY_AFTER))
+            self.send_json({'success': False, 'error': 'Server busy, retry later'}, status=503)
+        return self.admitted
+
+    async def call(self, func, *args, **kwargs):
+        """Runs func on the worker pool, holding the admission slot until it returns"""
+        self.working = True
+        try:
+            return await self.service.call(func, *args, **kwargs)
+        finally:
+            self.work_done()
+
+    def work_done(self):
+        self.working = False
+        if self.connection_closed:
+            self.release()
+
+    def release(self):
+        if self.admitted:
+            self.service.release()
+            self.admitted = False
+
+    def on_finish(self):
+        self.release()
+        route = self.request.path.strip('/').replace('/', '.') or 'root'
+        metrics.observe(f"service.{route}", time.perf_counter() - self.started)
+        metrics.increment(f"service.status.{self.get_status()}")
+
+    def on_connection_close(self):
+        self.connection_closed = True
+        # Work already on a worker keeps its slot, so disconnects cannot bypass the cap
+        if not self.working:
+            self.release()
+
+    def json_body(self) -> Dict:
+        try:
+            body = json.loads(self.request.body or b'{}')
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason='Request body must be JSON')
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, reason='Request body must be a JSON object')
+        return body
+
+    def require(self, body: Dict, field: str) -> str:
+        value = body.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise tornado.web.HTTPError(400, reason=f"'{field}' is required")
+        return value
+
+    def send_json(self, payload, status: int = 200):
+        self.set_status(status)
+        self.set_header('Content-Type', 'application/json')
+        self.finish(to_json(payload))
+
+    def send_result(self, result: Dict):
+        self.send_json(result, status=200 if result.get('success') else 502)
+
+    def write_error(self, status_code: int, **kwargs):
+        self.set_header('Content-Type', 'application/json')
+        self.finish(to_json({'success': False, 'error': self._reason}))
+
+
+class HealthHandler(BaseHandler):
+
+    def get(self):
+        self.send_json({
+            'status': 'ok',
+            'in_flight': self.service.in_flight,
+            'capacity': self.service.max_in_flight,
+            'warm': self.service.warmer.warmed.is_set() if self.service.warmer else None
+        })
+
+
+class MetricsHandler(BaseHandler):
+
+    def get(self):
+        snapshot = metrics.snapshot()
+        snapshot['in_flight'] = self.service.in_flight
+        snapshot['speculation'] = self.service.platform.speculation_report()
+        if self.service.mentor.prefetcher is not None:
+            snapshot['solution_prefetch'] = self.service.mentor.prefetcher.report()
+        router = default_router()
+        if router is not None:
+            snapshot['model_routing'] = router.report()
+        pool = default_key_pool()
+        if pool is not None:
+            snapshot['api_keys'] = pool.stats()
+        self.send_json(snapshot)
+
+
+@tornado.web.stream_request_body
+class ImageAnalysisHandler(BaseHandler):
+    """Accepts a multipart 'image' field (or a raw image body) and streams NDJSON stage events"""
+
+    def prepare(self):
+        self.parser, self.raw_file = None, None
+        self.body_error = None
+        # Reject before reading the body so busy servers shed load cheaply
+        if not self.admit():
+            return
+        self.request.connection.set_max_body_size(Config.MAX_IMAGE_SIZE + 64 * 1024)
+
+        content_type = self.request.headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+            boundary = re.search(r'boundary="?([^";]+)"?', content_type)
+            if not boundary:
+                raise tornado.web.HTTPError(400, reason='Missing multipart boundary')
+            self.parser = MultipartStreamParser(boundary.group(1).encode())
+        elif content_type.startswith('image/'):
+            extension = content_type.split('/', 1)[1].split(';')[0].strip()
+            if extension not in Config.ALLOWED_EXTENSIONS:
+                raise tornado.web.HTTPError(415, reason=f"Unsupported image type '{extension}'")
+            self.raw_file = tempfile.NamedTemporaryFile(suffix=f".{extension}", delete=False)
+        else:
+            raise tornado.web.HTTPError(415, reason='Send multipart/form-data or an image/* body')
+
+    def data_received(self, chunk: bytes):
+        # Errors raised here never reach the client, so they are kept for post() to report
+        if not self.admitted or self.body_error:
+            return
+        try:
+            if self.parser:
+                self.parser.feed(chunk)
+            else:
+                self.raw_file.write(chunk)
+        except ValueError as e:
+            self.body_error = str(e)
+
+    async def post(self):
+        image_path, domains = self._upload()
+        cancelled = threading.Event()
+        producer = None
+        try:
+            self.set_header('Content-Type', 'application/x-ndjson')
+            # Bounded, so a slow client holds the worker back instead of piling up events
+            queue = asyncio.Queue(maxsize=Config.SERVICE_EVENT_BUFFER)
+            loop = asyncio.get_running_loop()
+
+            def emit(event) -> bool:
+                put = asyncio.run_coroutine_threadsafe(queue.put(event), loop)
+                while True:
+                    try:
+                        put.result(timeout=0.25)
+                        return True
+                    except FutureTimeout:
+                        if cancelled.is_set():
+                            put.cancel()
+                            return False
+
+            def produce():
+                events = self.service.platform.iter_process_image(image_path, domains)
+                try:
+                    for event in events:
+                        if cancelled.is_set() or not emit(event):
+                            break
+                except Exception as e:
+                    emit({
+                        'stage': 'complete', 'success': False,
+                        'data': {'success': False, 'error': str(e), 'step': 'service'}
+                    })
+                finally:
+                    events.close()
+
+            self.working = True
+            producer = loop.run_in_executor(self.service.executor, produce)
+            while True:
+                event = await queue.get()
+                self.write(to_json(event) + '\n')
+                await self.flush()
+                if event['stage'] == 'complete':
+                    break
+            await producer
+            self.finish()
+        except StreamClosedError:
+            metrics.increment('service.client_disconnects')
+        finally:
+            cancelled.set()
+            if producer is not None:
+                # The worker may still be reading the upload; it stops after the current stage
+                await asyncio.wait({producer})
+                self.work_done()
+            os.remove(image_path)
+
+    def on_finish(self):
+        self._discard_upload()
+        super().on_finish()
+
+    def _upload(self):
+        if self.body_error:
+            raise tornado.web.HTTPError(400, reason=self.body_error)
+        if self.parser:
+            try:
+                self.parser.finish()
+            except ValueError as e:
+                raise tornado.web.HTTPError(400, reason=str(e))
+            upload = self.parser.files.get('image')
+            if upload is None:
+                self.parser.cleanup()
+                raise tornado.web.HTTPError(400, reason="Missing 'image' file field")
+            extension = os.path.splitext(upload['filename'])[1].lstrip('.').lower()
+            if extension not in Config.ALLOWED_EXTENSIONS:
+                self.parser.cleanup()
+                raise tornado.web.HTTPError(415, reason=f"Unsupported image type '{extension}'")
+            domains = self.parser.fields.get('domains')
+            image_path = upload['path']
+        else:
+            self.raw_file.close()
+            domains = self.get_query_argument('domains', None)
+            image_path = self.raw_file.name
+        self.parser, self.raw_file = None, None
+
+        if domains:
+            domains = [domain.strip() for domain in domains.split(',') if domain.strip()]
+        return image_path, domains or None
+
+    def _discard_upload(self):
+        # Covers requests rejected or failed before post() took ownership of the file
+        if getattr(self, 'parser', None):
+            self.parser.cleanup()
+        if getattr(self, 'raw_file', None):
+            self.raw_file.close()
+            os.remove(self.raw_file.name)
+
+
+class TextAnalysisHandler(BaseHandler):
+
+    async def post(self):
+        body = self.json_body()
+        description = self.require(body, 'description')
+        if not self.admit():
+            return
+        if body.get('guidance'):
+            result = await self.call(self.service.platform.process_text_with_guidance,
+                                             description, body.get('speculative'))
+        else:
+            result = await self.call(self.service.platform.process_text_description,
+                                             description, body.get('speculative'))
+        self.send_result(result)
+
+
+class ClassifyHandler(BaseHandler):
+
+    async def post(self):
+        body = self.json_body()
+        description = self.require(body, 'description')
+        if not self.admit():
+            return
+        result = await self.call(
+            self.service.platform.problem_classifier.classify_problem, description
+        )
+        self.send_result(result)
+
+
+class MissionHandler(BaseHandler):
+
+    async def post(self):
+        body = self.json_body()
+        description = self.require(body, 'description')
+        if not self.admit():
+            return
+        result = await self.call(
+            self.service.platform.mission_generator.generate_mission_statement,
+            description, body.get('context')
+        )
+        self.send_result(result)
+
+
+class MentorHandler(BaseHandler):
+
+    async def post(self, mode: str):
+        body = self.json_body()
+        mentor = self.service.mentor
+
+        if mode == 'socratic':
+            problem = self.require(body, 'problem')
+            call = (mentor.critical_thinking_mode, problem, body.get('context'))
+        elif mode == 'solution':
+            problem = self.require(body, 'problem')
+            call = (mentor.solution_mode, problem, body.get('template_type', 'auto'),
+                    body.get('category'))
+        else:
+            # Chat history travels with the request so any replica can answer
+            message = self.require(body, 'message')
+            history = body.get('history') or []
+            if not isinstance(history, list) or not all(
+                    isinstance(entry, dict) and isinstance(entry.get('role'), str)
+                    and isinstance(entry.get('content'), str) for entry in history):
+                raise tornado.web.HTTPError(
+                    400, reason="'history' must be a list of objects with string 'role' and 'content'")
+            call = (lambda: mentor.interactive_mentoring(
+                message, body.get('mode', 'critical_thinking'), history=history),)
+
+        if not self.admit():
+            return
+        result = await self.call(*call)
+        self.send_result(result)
+
+
+def make_app(service: Optional[AnalysisService] = None) -> tornado.web.Application:
+    service = service or AnalysisService()
+    args = {'service': service}
+    return tornado.web.Application([
+        (r'/health', HealthHandler, args),
+        (r'/metrics', MetricsHandler, args),
+        (r'/v1/analyze/image', ImageAnalysisHandler, args),
+        (r'/v1/analyze/text', TextAnalysisHandler, args),
+        (r'/v1/classify', ClassifyHandler, args),
+        (r'/v1/mission', MissionHandler, args),
+        (r'/v1/mentor/(socratic|solution|chat)', MentorHandler, args),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless HTTP API for the AI Learning Platform")
+    parser.add_argument('--port', type=int, default=Config.SERVICE_PORT)
+    parser.add_argument('--address', default='0.0.0.0')
+    args = parser.parse_args()
+
+    service = AnalysisService()
+    service.warmer = start_warmer(service.platform, service.mentor)
+    app = make_app(service)
+    app.listen(args.port, address=args.address, max_body_size=Config.MAX_IMAGE_SIZE + 64 * 1024)
+    print(f"Serving on http://{args.address}:{args.port}")
+    try:
+        tornado.ioloop.IOLoop.current().start()
+    finally:
+        service.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import hashlib
+import io
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Iterator, List, Optional, Tuple
+from config import Config
+from image_quality import assess_image_quality
+from result_types import VisionResult
+from vision_detector import CommunityIssueDetector
+
+
+def prepare_image(image_path: str, max_side: int, quality: int) -> Dict:
+    """Decodes, orients, resizes and re-encodes one image in a worker process
+
+    The JPEG bytes are left in a shared memory block so only its name crosses
+    the process boundary.
+    """
+    from PIL import Image, ImageOps
+    
+    try:
+        with Image.open(image_path) as img:
+            img = ImageOps.exif_transpose(img)
+            img = img.convert('RGB')
+            # Assessed before resizing so the resolution check sees the upload's real size
+            image_quality = assess_image_quality(img) if Config.QUALITY_GATE != 'off' else None
+            img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            width, height = img.size
+            
+            buffer = io.BytesIO()
+            img.save(buffer, format='JPEG', quality=quality, optimize=True)
+        
+        data = buffer.getbuffer()
+        # Registered with the parent's resource tracker, which reclaims it if the parent dies
+        block = shared_memory.SharedMemory(create=True, size=len(data))
+        block.buf[:len(data)] = data
+        block.close()
+        
+        return {
+            'image_path': image_path,
+            'shm_name': block.name,
+            'size': len(data),
+            'digest': hashlib.sha256(data).hexdigest(),
+            'width': width,
+            'height': height,
+            'quality': image_quality
+        }
+        
+    except Exception as e:
+        return {'image_path': image_path, 'error': str(e)}
+
+
+def _take_shared_bytes(prepared: Dict) -> bytes:
+    block = shared_memory.SharedMemory(name=prepared['shm_name'])
+    try:
+        return bytes(block.buf[:prepared['size']])
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _discard_prepared(prepare_future):
+    """Done callback that unlinks the block of a prepared image nobody will consume"""
+    if prepare_future.cancelled() or prepare_future.exception() is not None:
+        return
+    prepared = prepare_future.result()
+    if 'shm_name' not in prepared:
+        return
+    try:
+        block = shared_memory.SharedMemory(name=prepared['shm_name'])
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+class ImageBatchPipeline:
+    """Prepares images on a process pool and feeds them to model calls on an I/O thread pool"""
+    
+    def __init__(self, detector: Optional[CommunityIssueDetector] = None,
+                 cpu_workers: Optional[int] = None, io_workers: Optional[int] = None,
+                 max_side: Optional[int] = None, quality: Optional[int] = None):
+        self.detector = detector or CommunityIssueDetector()
+        self.cpu_workers = cpu_workers or Config.CPU_WORKERS
+        self.io_workers = io_workers or Config.IO_WORKERS
+        self.max_side = max_side or Config.PREPARE_MAX_SIDE
+        self.quality = quality or Config.PREPARE_JPEG_QUALITY
+        # Started before the workers so they share it instead of each reclaiming blocks on exit
+        resource_tracker.ensure_running()
+        self._cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers)
+        self._io_pool = ThreadPoolExecutor(max_workers=self.io_workers,
+                                           thread_name_prefix='vision-io')
+    
+    def run(self, image_paths: List[str], domains: Optional[List[str]] = None) -> List[VisionResult]:
+        results = [None] * len(image_paths)
+        for index, result in self.iter_run(image_paths, domains):
+            results[index] = result
+        return results
+    
+    def iter_run(self, image_paths: List[str],
+                 domains: Optional[List[str]] = None) -> Iterator[Tuple[int, VisionResult]]:
+        """Yields (index, result) pairs as each image finishes, in completion order"""
+        # Bound the images in flight so encoded blocks never pile up in shared memory
+        window = self.cpu_workers + 2 * self.io_workers
+        queued = iter(enumerate(image_paths))
+        preparing, calling = {}, {}
+        
+        def fill():
+            while len(preparing) + len(calling) < window:
+                try:
+                    index, image_path = next(queued)
+                except StopIteration:
+                    return
+                future = self._cpu_pool.submit(prepare_image, image_path, self.max_side, self.quality)
+                preparing[future] = index
+        
+        try:
+            fill()
+            while preparing or calling:
+                done, _ = wait(list(preparing) + list(calling), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in preparing:
+                        index = preparing.pop(future)
+                        calling[self._io_pool.submit(self._analyze, future, domains)] = (index, future)
+                    else:
+                        yield calling.pop(future)[0], future.result()
+                fill()
+        finally:
+            # Work is only outstanding here when the consumer stopped early; blocks that
+            # no model call will take are unlinked as soon as their preparation ends
+            for future in preparing:
+                future.cancel()
+                future.add_done_callback(_discard_prepared)
+            for future, (_, prepare_future) in calling.items():
+                if future.cancel():
+                    prepare_future.add_done_callback(_discard_prepared)
+    
+    def close(self):
+        self._cpu_pool.shutdown(cancel_futures=True)
+        self._io_pool.shutdown(cancel_futures=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def _analyze(self, prepare_future, domains: Optional[List[str]]) -> VisionResult:
+        try:
+            prepared = prepare_future.result()
+        except Exception as e:
+            prepared = {'error': str(e)}
+        
+        if 'error' in prepared:
+            return VisionResult(
+                success=False,
+                error=prepared['error'],
+                domains_analyzed=domains or Config.CATEGORIES,
+                image_path=prepared.get('image_path')
+            )
+        
+        result = self.detector.detect_issues_from_bytes(_take_shared_bytes(prepared),
+                                                        domains=domains,
+                                                        quality=prepared.get('quality'))
+        result['image_path'] = prepared['image_path']
+        result['image_digest'] = prepared['digest']
+        return result
+
+
+# Convenience function
+def detect_image_batch(image_paths: List[str],
+                       domains: Optional[List[str]] = None) -> List[VisionResult]:
+    with ImageBatchPipeline() as pipeline:
+        return pipeline.run(image_paths, domains)
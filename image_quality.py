@@ -0,0 +1,70 @@
+from typing import Dict, Optional, Tuple
+import numpy as np
+from config import Config
+
+# Readable reasons for each failed check, used in rejection messages
+QUALITY_ISSUES = {
+    'too_small': "resolution too low",
+    'too_dark': "too dark",
+    'overexposed': "overexposed",
+    'blank': "nearly uniform (blank)",
+    'blurry': "too blurry"
+}
+
+
+def assess_image_quality(img, original_size: Optional[Tuple[int, int]] = None) -> Dict:
+    """Scores resolution, exposure, uniformity and blur of a PIL image without any API call
+
+    Checks run on a grayscale copy scaled to Config.QUALITY_SAMPLE_SIDE, so scores
+    compare across upload sizes. original_size is the size before any decode-time
+    downscaling and is what the resolution check uses.
+    """
+    width, height = original_size or img.size
+    gray = img.convert('L')
+    scale = Config.QUALITY_SAMPLE_SIDE / max(gray.size)
+    if scale < 1:
+        gray = gray.resize((max(1, round(gray.width * scale)), max(1, round(gray.height * scale))))
+    pixels = np.asarray(gray, dtype=np.float32)
+
+    histogram = np.bincount(pixels.astype(np.uint8).ravel(), minlength=256) / pixels.size
+    brightness = float(pixels.mean())
+    contrast = float(pixels.std())
+    dark_fraction = float(histogram[:16].sum())
+    bright_fraction = float(histogram[240:].sum())
+
+    # Variance of the 4-neighbour Laplacian: low when edges are soft
+    if min(pixels.shape) >= 3:
+        laplacian = (pixels[1:-1, :-2] + pixels[1:-1, 2:] + pixels[:-2, 1:-1] + pixels[2:, 1:-1]
+                     - 4 * pixels[1:-1, 1:-1])
+        sharpness = float(laplacian.var())
+    else:
+        sharpness = 0.0
+
+    issues = []
+    if min(width, height) < Config.QUALITY_MIN_SIDE:
+        issues.append('too_small')
+    if brightness < Config.QUALITY_MIN_BRIGHTNESS or dark_fraction > Config.QUALITY_MAX_CLIPPED:
+        issues.append('too_dark')
+    elif brightness > Config.QUALITY_MAX_BRIGHTNESS or bright_fraction > Config.QUALITY_MAX_CLIPPED:
+        issues.append('overexposed')
+    if contrast < Config.QUALITY_MIN_CONTRAST:
+        issues.append('blank')
+    elif sharpness < Config.QUALITY_MIN_SHARPNESS:
+        # A blank image has no edges either; that is reported once, as blank
+        issues.append('blurry')
+
+    return {
+        'usable': not issues,
+        'issues': issues,
+        'width': width,
+        'height': height,
+        'brightness': brightness,
+        'contrast': contrast,
+        'dark_fraction': dark_fraction,
+        'bright_fraction': bright_fraction,
+        'sharpness': sharpness
+    }
+
+
+def describe_quality_issues(quality: Dict) -> str:
+    return ', '.join(QUALITY_ISSUES.get(issue, issue) for issue in quality['issues'])
@@ -1,135 +1,453 @@
-from typing import Dict, Optional, List
+import asyncio
+import hashlib
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from typing import AsyncIterator, Dict, Iterator, Optional, List, Tuple
 from vision_detector import CommunityIssueDetector
 from mission_generator import MissionStatementGenerator
 from problem_classifier import ProblemClassifier
+from prompt_compaction import PromptCompactor
+from ai_mentor import AIMentor
+from result_cache import ResultCache
+from stage_graph import Stage, StageGraph
+from profiling import RunProfiler, profiled
 from config import Config
+from metrics import metrics
 
 
 class AILearningPlatform:
     
-    def __init__(self, api_key: Optional[str] = None):
+    # Words too common across domains to hint at a category
+    _GENERIC_TERMS = {'poor', 'lack', 'of', 'absence', 'inadequate', 'public', 'school'}
+    
+    def __init__(self, api_key: Optional[str] = None, results_store=None,
+                 profiler: Optional[RunProfiler] = None):
         Config.validate()
         
+        self.results_store = results_store
+        if profiler is None and Config.PROFILE_SAMPLE_RATE > 0:
+            profiler = RunProfiler()
+        self.profiler = profiler
+        
         self.vision_detector = CommunityIssueDetector(api_key)
         self.mission_generator = MissionStatementGenerator(api_key)
         self.problem_classifier = ProblemClassifier(api_key)
+        self.mentor = AIMentor(api_key)
+        self.compactor = PromptCompactor()
+        
+        # Whole-image runs get their own pool; each runs its stages inline or on a per-run pool
+        self._batch_executor = ThreadPoolExecutor(max_workers=Config.BATCH_MAX_IN_FLIGHT,
+                                                  thread_name_prefix='batch')
+        self._stats_lock = threading.Lock()
+        self.speculation_stats = {'attempts': 0, 'hits': 0, 'misses': 0, 'latency_saved': 0.0}
+        self._build_graphs()
+    
+    def _build_graphs(self):
+        stage_cache = ResultCache(Config.STAGE_CACHE_SIZE)
+        
+        self.image_graph = StageGraph([
+            Stage('vision_detection', self._detect_stage, ['image_path', 'image_digest', 'domains']),
+            Stage('classification', self._classify_vision_stage, ['vision_detection']),
+            Stage('problem_extraction', self._extract_stage, ['vision_detection'], cache=False),
+            Stage('mission_generation', self._image_mission_stage,
+                  ['problem_extraction', 'classification'])
+        ], cache=stage_cache)
+        
+        classification = Stage('classification', self._classify_text_stage, ['problem_description'])
+        guidance = Stage('guidance', self._guidance_stage, ['problem_description', 'classification'])
+        self.text_graph = StageGraph([
+            classification,
+            Stage('mission_generation', self._text_mission_stage,
+                  ['problem_description', 'classification'])
+        ], cache=stage_cache)
+        
+        # The speculative branch only exists when asked for, so the default path stays inline
+        self.speculative_text_graph = StageGraph([
+            Stage('predicted_category', self.predict_category, ['problem_description'], cache=False),
+            classification,
+            Stage('speculative_mission', self._speculative_mission_stage,
+                  ['problem_description', 'predicted_category']),
+            Stage('mission_generation', self._text_mission_stage,
+                  ['problem_description', 'classification', 'predicted_category',
+                   'speculative_mission'])
+        ], cache=stage_cache)
+        
+        # Socratic guidance runs alongside mission generation once the category is known
+        self.guided_text_graph = self.text_graph.extend([guidance])
+        self.speculative_guided_text_graph = self.speculative_text_graph.extend([guidance])
     
+    @profiled('image_analysis')
     def process_image(self, image_path: str, 
                      domains: Optional[List[str]] = None) -> Dict:
+        result = None
+        for event in self.iter_process_image(image_path, domains):
+            if event['stage'] == 'complete':
+                result = event['data']
+        return result
+    
+    def iter_process_image(self, image_path: str,
+                           domains: Optional[List[str]] = None) -> Iterator[Dict]:
+        """Yields one event per pipeline stage as it finishes, then a 'complete' event"""
         print("Analyzing image for community issues...")
         
-        # Step 1: Detect issues in the image
-        vision_result = self.vision_detector.detect_issues(image_path, domains)
+        # The consumer runs in this generator's context between events, so the session is
+        # made current only around each stage, never across a yield
+        with self._profile_session('image_analysis', profile_caller=False) as session:
+            run = None
+            for event in self.image_graph.iter_run(session, image_path=image_path,
+                                                   image_digest=self._file_digest(image_path),
+                                                   domains=domains):
+                if event['stage'] == 'complete':
+                    run = event['data']
+                else:
+                    yield event
         
-        if not vision_result['success']:
-            return {
-                'success': False,
-                'error': vision_result.get('error', 'Vision detection failed'),
-                'step': 'vision_detection'
+        if not run['success']:
+            result = self._failure(run, 'image')
+            result['image_path'] = image_path
+        else:
+            outputs = run['outputs']
+            vision_result = outputs['vision_detection']
+            classification = outputs['classification']
+            mission = outputs['mission_generation']
+            result = {
+                'success': True,
+                'source': 'image',
+                'image_path': image_path,
+                'vision_analysis': vision_result['analysis'],
+                'classification': classification,
+                'mission_statement': mission,
+                'summary': self._create_summary(vision_result, classification, mission),
+                'token_savings': self._token_savings(classification, outputs['problem_extraction'])
             }
+        if session is not None:
+            result['profile_report'] = session.report_path
+        self._record(result)
+        yield {'stage': 'complete', 'success': result['success'], 'cached': False, 'data': result}
+    
+    @profiled('text_analysis')
+    def process_text_description(self, problem_description: str,
+                                 speculative: Optional[bool] = None) -> Dict:
+        print("Processing problem description...")
+        run = self._run_text_graph(problem_description, speculative, guided=False)
+        result = self._text_result(problem_description, run)
+        self._record(result)
+        return result
+    
+    @profiled('guided_text_analysis')
+    def process_text_with_guidance(self, problem_description: str,
+                                   speculative: Optional[bool] = None) -> Dict:
+        print("Processing problem description with mentor guidance...")
+        run = self._run_text_graph(problem_description, speculative, guided=True)
+        result = self._text_result(problem_description, run)
+        if result['success']:
+            result['guidance'] = run['outputs']['guidance']
+        self._record(result)
+        return result
+    
+    def _run_text_graph(self, problem_description: str, speculative: Optional[bool],
+                        guided: bool) -> Dict:
+        if speculative is None:
+            speculative = Config.SPECULATIVE_MISSION
+        if speculative:
+            graph = self.speculative_guided_text_graph if guided else self.speculative_text_graph
+        else:
+            graph = self.guided_text_graph if guided else self.text_graph
+        run = graph.run(problem_description=problem_description)
         
-        print("Issues detected in image")
-        print("\nClassifying the detected problems...")
+        outputs = run['outputs']
+        predicted = outputs.get('predicted_category')
+        # Only score speculation that actually raced the classifier
+        if predicted and 'classification' in outputs and run['timings'].get('classification'):
+            hit = outputs['classification']['category'] == predicted
+            timings = run['timings']
+            mission_seconds = timings.get('speculative_mission' if hit else 'mission_generation', 0.0)
+            # Saved time compares against running the two calls back to back
+            latency_saved = timings['classification'] + mission_seconds - run['elapsed']
+            run['speculation'] = self._record_speculation(predicted, hit, latency_saved)
+        return run
+    
+    def _text_result(self, problem_description: str, run: Dict) -> Dict:
+        if not run['success']:
+            result = self._failure(run, 'text')
+            result['original_description'] = problem_description
+            return result
         
-        # Step 2: Classify the detected issues
+        classification = run['outputs']['classification']
+        mission = run['outputs']['mission_generation']
+        result = {
+            'success': True,
+            'source': 'text',
+            'original_description': problem_description,
+            'classification': classification,
+            'mission_statement': mission,
+            'summary': self._create_text_summary(problem_description, classification, mission)
+        }
+        if 'speculation' in run:
+            result['speculation'] = run['speculation']
+        return result
+    
+    def _profile_session(self, run_name: str, profile_caller: bool = True):
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.session(run_name, profile_caller)
+    
+    def _record(self, result: Dict):
+        if self.results_store is not None:
+            self.results_store.append(result)
+    
+    def _failure(self, run: Dict, source: str) -> Dict:
+        result = {
+            'success': False,
+            'source': source,
+            'error': run['error'],
+            'step': run['failed_stage']
+        }
+        if 'classification' in run['outputs']:
+            result['classification'] = run['outputs']['classification']
+        return result
+    
+    # --------------------------
+    # Pipeline stages
+    # --------------------------
+    def _detect_stage(self, image_path: str, image_digest: Optional[str],
+                      domains: Optional[List[str]]) -> Dict:
+        vision_result = self.vision_detector.detect_issues(image_path, domains)
+        if vision_result['success']:
+            print("Issues detected in image")
+        return vision_result
+    
+    def _classify_vision_stage(self, vision_detection: Dict) -> Dict:
+        print("\nClassifying the detected problems...")
         classification = self.problem_classifier.classify_with_vision_analysis(
-            vision_result['analysis']
+            vision_detection['analysis']
         )
-        
         print(f"Classified as: {classification.get('category', 'Unknown')}")
-        
-        # Step 3: Extract key problem description for mission generation
-        problem_desc = self._extract_problem_description(vision_result['analysis'])
-
+        return classification
+    
+    def _extract_stage(self, vision_detection: Dict) -> Dict:
+        return self.compactor.compact(vision_detection['analysis'], 'mission_generation')
+    
+    def _image_mission_stage(self, problem_extraction: Dict, classification: Dict) -> Dict:
         print("\nGenerating mission statement...")
-        
-        # Step 4: Generate mission statement
         mission = self.mission_generator.generate_mission_statement(
-            problem_desc,
+            problem_extraction['text'],
             context=f"Based on visual analysis. Category: {classification.get('category')}"
         )
-
         print("Mission statement generated")
-
-        return {
-            'success': True,
-            'image_path': image_path,
-            'vision_analysis': vision_result['analysis'],
-            'classification': classification,
-            'mission_statement': mission,
-            'summary': self._create_summary(vision_result, classification, mission)
-        }
+        return mission
     
-    def process_text_description(self, problem_description: str) -> Dict:
-        print("Processing problem description...")
-        
-        # Step 1: Classify the problem
+    def _classify_text_stage(self, problem_description: str) -> Dict:
         classification = self.problem_classifier.classify_problem(problem_description)
+        if classification['success']:
+            print(f"Classified as: {classification['category']}")
+        return classification
+    
+    def _speculative_mission_stage(self, problem_description: str,
+                                   predicted_category: Optional[str]) -> Dict:
+        if not predicted_category:
+            return {'success': True, 'skipped': True}
         
-        if not classification['success']:
-            return {
-                'success': False,
-                'error': classification.get('error', 'Classification failed'),
-                'step': 'classification'
-            }
+        print(f"Predicted category: {predicted_category}. Generating mission alongside classification...")
+        mission = self.mission_generator.generate_mission_statement(
+            problem_description,
+            context=f"Category: {predicted_category}"
+        )
+        # A failed guess is not fatal; the mission stage regenerates it
+        return mission if mission['success'] else {'success': True, 'skipped': True}
+    
+    def _text_mission_stage(self, problem_description: str, classification: Dict,
+                            predicted_category: Optional[str] = None,
+                            speculative_mission: Optional[Dict] = None) -> Dict:
+        if (predicted_category and classification['category'] == predicted_category
+                and not speculative_mission.get('skipped')):
+            print("Mission statement generated")
+            return speculative_mission
         
-        print(f"Classified as: {classification['category']}")
+        if predicted_category:
+            print("Prediction missed, regenerating mission statement...")
         print("\nGenerating mission statement...")
-        
-        # Step 2: Generate mission statement
         mission = self.mission_generator.generate_mission_statement(
             problem_description,
             context=f"Category: {classification['category']}"
         )
+        if mission['success']:
+            print("Mission statement generated")
+        return mission
+    
+    def _guidance_stage(self, problem_description: str, classification: Dict) -> Dict:
+        return self.mentor.critical_thinking_mode(
+            problem_description,
+            context=f"Category: {classification['category']}"
+        )
+    
+    def _file_digest(self, path: str) -> Optional[str]:
+        try:
+            with open(path, 'rb') as f:
+                return hashlib.file_digest(f, 'sha256').hexdigest()
+        except OSError:
+            return None
+    
+    def predict_category(self, problem_description: str) -> Optional[str]:
+        """Cheap keyword guess at the category, or None when there is no clear winner"""
+        text = problem_description.lower()
+        words = set(re.findall(r'[a-z]+', text))
         
-        if not mission['success']:
-            return {
-                'success': False,
-                'error': mission.get('error', 'Mission generation failed'),
-                'step': 'mission_generation',
-                'classification': classification
-            }
+        scores = {}
+        for category, issues in Config.DOMAIN_ISSUES.items():
+            score = 0
+            for issue in issues:
+                if issue in text:
+                    score += 3
+                else:
+                    score += len(words & (set(issue.split()) - self._GENERIC_TERMS))
+            scores[category] = score
         
-        print("Mission statement generated")
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] == 0:
+            return None
+        if len(ranked) > 1 and ranked[0][1] == ranked[1][1]:
+            return None
+        return ranked[0][0]
+    
+    def speculation_report(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self.speculation_stats)
+        attempts = stats['attempts']
+        stats['hit_rate'] = stats['hits'] / attempts if attempts else 0.0
+        return stats
+    
+    def _record_speculation(self, predicted: str, hit: bool, latency_saved: float) -> Dict:
+        with self._stats_lock:
+            self.speculation_stats['attempts'] += 1
+            self.speculation_stats['hits' if hit else 'misses'] += 1
+            self.speculation_stats['latency_saved'] += latency_saved
         
+        print(f"Speculation {'hit' if hit else 'missed'}, saved {latency_saved:.2f}s")
         return {
-            'success': True,
-            'original_description': problem_description,
-            'classification': classification,
-            'mission_statement': mission,
-            'summary': self._create_text_summary(problem_description, classification, mission)
+            'predicted_category': predicted,
+            'hit': hit,
+            'latency_saved': latency_saved
         }
     
     def process_multiple_images(self, image_paths: List[str]) -> List[Dict]:
-        results = []
-        for i, image_path in enumerate(image_paths, 1):
+        results = [None] * len(image_paths)
+        for done, (index, result) in enumerate(self.iter_multiple_images(image_paths), 1):
             print(f"\n{'='*60}")
-            print(f"Processing Image {i}/{len(image_paths)}")
+            print(f"Finished Image {index + 1} ({done}/{len(image_paths)} done)")
             print(f"{'='*60}")
-            
-            result = self.process_image(image_path)
-            results.append(result)
+            results[index] = result
         
         return results
     
+    def iter_multiple_images(self, image_paths: List[str], domains: Optional[List[str]] = None,
+                             max_in_flight: Optional[int] = None,
+                             ordered: bool = False) -> Iterator[Tuple[int, Dict]]:
+        """Yields (index, result) as each image finishes, or in input order when ordered
+
+        At most max_in_flight images are running or waiting to be yielded, so a slow
+        consumer holds back new work instead of buffering results.
+        """
+        window = max_in_flight or Config.BATCH_MAX_IN_FLIGHT
+        queued = iter(enumerate(image_paths))
+        running, finished = {}, {}
+        next_index = 0
+        try:
+            while True:
+                while len(running) + len(finished) < window:
+                    item = next(queued, None)
+                    if item is None:
+                        break
+                    index, image_path = item
+                    future = self._batch_executor.submit(self._safe_process_image, image_path, domains)
+                    running[future] = index
+                if not running and not finished:
+                    return
+                
+                if running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finished[running.pop(future)] = future.result()
+                
+                if ordered:
+                    while next_index in finished:
+                        yield next_index, finished.pop(next_index)
+                        next_index += 1
+                else:
+                    for index in sorted(finished):
+                        yield index, finished.pop(index)
+        finally:
+            # A consumer that stops early abandons whatever has not started yet
+            for future in running:
+                future.cancel()
+    
+    async def aiter_multiple_images(self, image_paths: List[str], domains: Optional[List[str]] = None,
+                                    max_in_flight: Optional[int] = None,
+                                    ordered: bool = False) -> AsyncIterator[Tuple[int, Dict]]:
+        """Async counterpart of iter_multiple_images; images run in the batch pool"""
+        loop = asyncio.get_running_loop()
+        window = max_in_flight or Config.BATCH_MAX_IN_FLIGHT
+        queued = iter(enumerate(image_paths))
+        running, finished = {}, {}
+        next_index = 0
+        try:
+            while True:
+                while len(running) + len(finished) < window:
+                    item = next(queued, None)
+                    if item is None:
+                        break
+                    index, image_path = item
+                    future = loop.run_in_executor(self._batch_executor, self._safe_process_image,
+                                                  image_path, domains)
+                    running[future] = index
+                if not running and not finished:
+                    return
+                
+                if running:
+                    done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    for future in done:
+                        finished[running.pop(future)] = future.result()
+                
+                if ordered:
+                    while next_index in finished:
+                        yield next_index, finished.pop(next_index)
+                        next_index += 1
+                else:
+                    for index in sorted(finished):
+                        yield index, finished.pop(index)
+        finally:
+            for future in running:
+                future.cancel()
+    
+    def _safe_process_image(self, image_path: str, domains: Optional[List[str]]) -> Dict:
+        # One bad image must not end the whole batch
+        try:
+            result = self.process_image(image_path, domains)
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+        result.setdefault('image_path', image_path)
+        return result
+    
     def _extract_problem_description(self, vision_analysis: str) -> str:
-        # Look for detected issues section
-        if "DETECTED ISSUES:" in vision_analysis:
-            start = vision_analysis.find("DETECTED ISSUES:")
-            end = vision_analysis.find("VISUAL EVIDENCE:", start)
-            if end == -1:
-                end = vision_analysis.find("RECOMMENDATIONS:", start)
-            if end == -1:
-                end = len(vision_analysis)
-            
-            issues_section = vision_analysis[start:end].strip()
-            # Take first few lines as description
-            lines = [line.strip() for line in issues_section.split('\n') 
-                    if line.strip() and not line.strip().startswith('DETECTED')]
-            return ' '.join(lines[:3]) if lines else vision_analysis[:200]
-        
-        # Fallback: use first 200 characters
-        return vision_analysis[:200].strip()
+        return self.compactor.compact(vision_analysis, 'mission_generation')['text']
+    
+    def _token_savings(self, classification: Dict, problem_extraction: Dict) -> Dict:
+        """Input tokens each stage was spared by compacting the vision analysis"""
+        stages = {'mission_generation': PromptCompactor.stats(problem_extraction)}
+        # Locally derived classifications never sent a prompt
+        if 'compaction' in classification:
+            stages['classification'] = classification['compaction']
+        
+        saved = sum(stage['saved_tokens'] for stage in stages.values())
+        metrics.increment('compaction.tokens_saved', problem_extraction['saved_tokens'])
+        return {
+            'stages': stages,
+            'original_tokens': sum(stage['original_tokens'] for stage in stages.values()),
+            'sent_tokens': sum(stage['tokens'] for stage in stages.values()),
+            'saved_tokens': saved
+        }
     
     def _create_summary(self, vision_result: Dict, classification: Dict, 
                        mission: Dict) -> str:
@@ -0,0 +1,147 @@
+import re
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+from config import Config
+
+
+class AhoCorasick:
+    """Multi-pattern matcher that finds every pattern occurrence in one pass over the text"""
+
+    def __init__(self, patterns: Dict[str, object]):
+        # Node 0 is the root; each node has transitions, a failure link and outputs
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[Tuple[str, object]]] = [[]]
+
+        for pattern, value in patterns.items():
+            self._add(pattern.lower(), value)
+        self._build_failure_links()
+
+    def _add(self, pattern: str, value):
+        node = 0
+        for char in pattern:
+            if char not in self._goto[node]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+                self._goto[node][char] = len(self._goto) - 1
+            node = self._goto[node][char]
+        self._outputs[node].append((pattern, value))
+
+    def _build_failure_links(self):
+        # Breadth-first, so a node's failure link is resolved before its children's
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+
+    def find_all(self, text: str) -> Iterator[Tuple[int, int, str, object]]:
+        """Yields (start, end, pattern, value) for every match, whole words only"""
+        text = text.lower()
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for pattern, value in self._outputs[node]:
+                start, end = index - len(pattern) + 1, index + 1
+                if (start == 0 or not text[start - 1].isalnum()) and \
+                        (end == len(text) or not text[end].isalnum()):
+                    yield start, end, pattern, value
+
+
+class IssueExtractor:
+    """Turns a vision analysis into per-issue records and a locally derived category"""
+
+    SEVERITY_WEIGHTS = {'High': 3, 'Medium': 2, 'Low': 1}
+    SECTION_HEADERS = ('VISUAL EVIDENCE:', 'RECOMMENDATIONS:')
+
+    _FIELD_LINE = re.compile(
+        r'^[-*•\s]*(?:\*\*)?\s*(?:domain|category|severity|description|impact|location)\b[^:\n]{0,12}:',
+        re.IGNORECASE)
+    _SEVERITY = re.compile(r'(?:severity(?:\s+level)?\W{0,4}|\(\s*)(high|medium|low)\b', re.IGNORECASE)
+
+    def __init__(self):
+        patterns = {}
+        for domain, issues in Config.DOMAIN_ISSUES.items():
+            patterns[domain] = ('domain', domain)
+            for issue in issues:
+                patterns[issue] = ('issue', domain)
+        self.matcher = AhoCorasick(patterns)
+
+    def extract(self, vision_analysis: str) -> List[Dict]:
+        records = []
+        for item in self._issue_items(vision_analysis):
+            record = self._parse_item(item)
+            if record:
+                records.append(record)
+        return records
+
+    def derive_category(self, records: List[Dict]) -> Dict:
+        scores = {}
+        for record in records:
+            if record['domain']:
+                weight = self.SEVERITY_WEIGHTS.get(record['severity'], 1)
+                scores[record['domain']] = scores.get(record['domain'], 0) + weight
+
+        total = sum(scores.values())
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if not ranked:
+            return {'category': None, 'share': 0.0, 'scores': scores, 'ambiguous': True}
+
+        category, top = ranked[0]
+        share = top / total
+        tied = len(ranked) > 1 and ranked[1][1] == top
+        return {
+            'category': category,
+            'share': share,
+            'scores': scores,
+            'ambiguous': tied or share < Config.LOCAL_CLASSIFY_MIN_SHARE
+        }
+
+    def _issue_items(self, vision_analysis: str) -> List[str]:
+        start = vision_analysis.find('DETECTED ISSUES:')
+        if start == -1:
+            return []
+        start += len('DETECTED ISSUES:')
+        ends = [vision_analysis.find(header, start) for header in self.SECTION_HEADERS]
+        end = min([index for index in ends if index != -1] or [len(vision_analysis)])
+
+        # Each top-level line starts an issue; indented lines and field lines
+        # ("Domain: ...", "Severity: ...") belong to the issue above them
+        items = []
+        for line in vision_analysis[start:end].split('\n'):
+            if not line.strip():
+                continue
+            continuation = line[:1].isspace() or self._FIELD_LINE.match(line)
+            if not items or not continuation:
+                items.append(line.strip())
+            else:
+                items[-1] += '\n' + line.strip()
+        return items
+
+    def _parse_item(self, item: str) -> Optional[Dict]:
+        explicit_domain, issue_domain, issue = None, None, None
+        for start, end, pattern, (kind, domain) in self.matcher.find_all(item):
+            # Labels are written capitalized; "health risk" in prose is not a label
+            if kind == 'domain' and explicit_domain is None and item[start:end] == domain:
+                explicit_domain = domain
+            elif kind == 'issue' and issue is None:
+                issue, issue_domain = pattern, domain
+
+        severity = self._SEVERITY.search(item)
+        if not (explicit_domain or issue_domain or severity):
+            return None
+
+        return {
+            'domain': explicit_domain or issue_domain,
+            'issue': issue,
+            'severity': severity.group(1).capitalize() if severity else None,
+            'text': item
+        }
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from config import Config
+
+
+class JobRunner:
+    """Runs pipeline analyses as background jobs on a shared, bounded worker pool"""
+    
+    ACTIVE_STATES = ('queued', 'running')
+    
+    def __init__(self, platform, result_cache=None, max_workers: Optional[int] = None,
+                 history_size: Optional[int] = None):
+        self.platform = platform
+        self.result_cache = result_cache
+        self.history_size = history_size or Config.JOB_HISTORY_SIZE
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or Config.JOB_WORKERS,
+            thread_name_prefix='analysis-job'
+        )
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def submit_image(self, image_path: str, key: Optional[str] = None,
+                     domains: Optional[List[str]] = None, delete_after: bool = False) -> str:
+        """delete_after removes image_path once the job has finished with it"""
+        return self._submit('image', key, self._run_image, image_path, domains, delete_after)
+    
+    def submit_text(self, problem_description: str, key: Optional[str] = None) -> str:
+        return self._submit('text', key, self._run_text, problem_description)
+    
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            # Hand out a snapshot so callers never see a half-updated job
+            snapshot = dict(job)
+            snapshot['events'] = list(job['events'])
+            return snapshot
+    
+    def active_job(self, key: str) -> Optional[str]:
+        """The id of the queued or running job for key, if any"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job['key'] == key and job['status'] in self.ACTIVE_STATES:
+                    return job['id']
+            return None
+    
+    def is_active(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        return job is not None and job['status'] in self.ACTIVE_STATES
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return counts
+    
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+    
+    def _submit(self, kind: str, key: Optional[str], target, *args) -> str:
+        with self._lock:
+            # Identical content already in flight: share that job
+            if key is not None:
+                for job in self._jobs.values():
+                    if job['key'] == key and job['status'] in self.ACTIVE_STATES:
+                        return job['id']
+            
+            job_id = uuid.uuid4().hex[:12]
+            self._jobs[job_id] = {
+                'id': job_id,
+                'kind': kind,
+                'key': key,
+                'status': 'queued',
+                'events': [],
+                'result': None,
+                'submitted_at': time.time(),
+                'finished_at': None
+            }
+            self._prune()
+        
+        self._executor.submit(target, job_id, *args)
+        return job_id
+    
+    def _run_image(self, job_id: str, image_path: str, domains: Optional[List[str]],
+                   delete_after: bool):
+        self._update(job_id, status='running')
+        result = None
+        try:
+            for event in self.platform.iter_process_image(image_path, domains):
+                if event['stage'] == 'complete':
+                    result = event['data']
+                else:
+                    with self._lock:
+                        self._jobs[job_id]['events'].append(event)
+        except Exception as e:
+            result = {'success': False, 'error': str(e), 'step': 'job'}
+        # Removed while the job still counts as active, so no new upload of this key is
+        # written to the same path before the file is gone
+        if delete_after and os.path.exists(image_path):
+            os.remove(image_path)
+        self._finish(job_id, result)
+    
+    def _run_text(self, job_id: str, problem_description: str):
+        self._update(job_id, status='running')
+        try:
+            result = self.platform.process_text_description(problem_description)
+        except Exception as e:
+            result = {'success': False, 'error': str(e), 'step': 'job'}
+        self._finish(job_id, result)
+    
+    def _finish(self, job_id: str, result: Dict):
+        with self._lock:
+            job = self._jobs[job_id]
+        if result['success'] and self.result_cache is not None and job['key'] is not None:
+            self.result_cache.put(job['key'], result)
+        self._update(job_id, result=result, finished_at=time.time(),
+                     status='done' if result['success'] else 'failed')
+    
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+    
+    def _prune(self):
+        # Forget the oldest finished jobs once history exceeds its bound
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job['status'] not in self.ACTIVE_STATES]
+        excess = len(self._jobs) - self.history_size
+        for job_id in finished[:max(excess, 0)]:
+            del self._jobs[job_id]
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+import google.ai.generativelanguage as glm
+from google.api_core import exceptions as api_exceptions
+from config import Config
+from metrics import metrics
+
+
+class ApiKeyState:
+    """One API key with its own client and rate-limit bookkeeping"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.label = f"...{key[-4:]}"
+        self.requests = deque()  # Start times within the last minute
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.blocked_until = 0.0
+        self.blocked_reason = None
+        self.total_requests = 0
+        self.total_failures = 0
+        self._client = None
+
+    @property
+    def client(self) -> glm.GenerativeServiceClient:
+        # Built on first use, so keys that are never picked open no channel
+        if self._client is None:
+            self._client = glm.GenerativeServiceClient(client_options={'api_key': self.key})
+        return self._client
+
+    def headroom(self, requests_per_minute: int, now: float) -> int:
+        while self.requests and now - self.requests[0] >= 60:
+            self.requests.popleft()
+        # In-flight calls already count here through their start times
+        return requests_per_minute - len(self.requests)
+
+    def available(self, now: float) -> bool:
+        return now >= self.blocked_until
+
+
+class ApiKeyPool:
+    """Routes each model call to the key with the most quota left, benching keys that keep failing"""
+
+    def __init__(self, keys: List[str], requests_per_minute: Optional[int] = None,
+                 failure_threshold: Optional[int] = None, quarantine_seconds: Optional[float] = None,
+                 rate_limit_cooldown: Optional[float] = None):
+        if not keys:
+            raise ValueError("ApiKeyPool needs at least one API key")
+        self.keys = [ApiKeyState(key) for key in dict.fromkeys(keys)]
+        self.requests_per_minute = requests_per_minute or Config.KEY_REQUESTS_PER_MINUTE
+        self.failure_threshold = failure_threshold or Config.KEY_FAILURE_THRESHOLD
+        self.quarantine_seconds = quarantine_seconds or Config.KEY_QUARANTINE_SECONDS
+        self.rate_limit_cooldown = rate_limit_cooldown or Config.KEY_RATE_LIMIT_COOLDOWN
+        self._lock = threading.Lock()
+
+    def acquire(self) -> ApiKeyState:
+        """Reserves the key with the most headroom; release it when the call ends"""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [state for state in self.keys if state.available(now)]
+            if candidates:
+                state = max(candidates, key=lambda s: (s.headroom(self.requests_per_minute, now),
+                                                       -s.in_flight))
+            else:
+                # Every key is benched; the one back soonest beats failing outright
+                state = min(self.keys, key=lambda s: s.blocked_until)
+                metrics.increment('key_pool.exhausted')
+            state.requests.append(now)
+            state.in_flight += 1
+            state.total_requests += 1
+            return state
+
+    def release(self, state: ApiKeyState, error: Optional[BaseException] = None):
+        with self._lock:
+            state.in_flight -= 1
+            if error is None:
+                state.consecutive_failures = 0
+                return
+
+            state.total_failures += 1
+            now = time.monotonic()
+            if self.is_rate_limit(error):
+                state.blocked_until = max(state.blocked_until, now + self.rate_limit_cooldown)
+                state.blocked_reason = 'rate_limited'
+                metrics.increment('key_pool.rate_limited')
+                return
+
+            state.consecutive_failures += 1
+            if state.consecutive_failures >= self.failure_threshold:
+                state.blocked_until = now + self.quarantine_seconds
+                state.blocked_reason = 'quarantined'
+                state.consecutive_failures = 0
+                metrics.increment('key_pool.quarantined')
+                print(f"API key {state.label} quarantined for {self.quarantine_seconds:.0f}s")
+
+    @staticmethod
+    def is_rate_limit(error: BaseException) -> bool:
+        return isinstance(error, api_exceptions.ResourceExhausted) or '429' in str(error)
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            now = time.monotonic()
+            return [{
+                'key': state.label,
+                'headroom': state.headroom(self.requests_per_minute, now),
+                'in_flight': state.in_flight,
+                'requests': state.total_requests,
+                'failures': state.total_failures,
+                'blocked': None if state.available(now) else state.blocked_reason,
+                'blocked_for': max(0.0, state.blocked_until - now)
+            } for state in self.keys]
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_key_pool() -> Optional[ApiKeyPool]:
+    """The process-wide pool over Config.GEMINI_API_KEYS, or None with fewer than two keys"""
+    global _default_pool
+    if len(Config.GEMINI_API_KEYS) < 2:
+        return None
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ApiKeyPool(Config.GEMINI_API_KEYS)
+        return _default_pool
@@ -0,0 +1,370 @@
+import argparse
+import contextlib
+import gc
+import json
+import os
+import random
+import re
+import resource
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+from PIL import Image
+from ai_mentor import AIMentor
+from config import Config
+from integrated_system import AILearningPlatform
+from metrics import Metrics
+
+SCENARIOS = ('text', 'image', 'socratic', 'solution', 'chat')
+
+# Roughly what the app sees: most visitors describe a problem or ask the mentor
+DEFAULT_MIX = {'text': 3, 'image': 2, 'socratic': 2, 'solution': 1, 'chat': 2}
+
+# Each problem with the category the fake backend is expected to give it
+PROBLEMS = [
+    ("Littered streets near the {place} market with plastic bags blocking the drainage", 'Environment'),
+    ("The clinic in {place} is overcrowded and staff lack safety gear", 'Health'),
+    ("Classrooms at {place} primary school are overcrowded and lack learning materials", 'Education'),
+    ("Illegal dumping along the {place} river is causing pollution", 'Environment'),
+    ("Poor hygiene in the {place} public toilets and no handwashing stations", 'Health'),
+    ("Damaged school infrastructure in {place} with leaking roofs and broken desks", 'Education'),
+    ("Community members in {place} need funding and a budget for a waste collection project", 'Environment'),
+    ("Deforestation around {place} has left slopes bare before the rainy season", 'Environment')
+]
+PLACES = ['Kibera', 'Mathare', 'Kawangware', 'Githurai', 'Kayole', 'Ruiru', 'Ongata', 'Limuru']
+CHAT_MESSAGES = [
+    "Where should we start?",
+    "Who else should we involve?",
+    "How do we know if it worked?",
+    "What could go wrong?",
+    "How can students help with this?"
+]
+
+
+class _FakeResponse:
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeBackend:
+    """Stand-in for genai.GenerativeModel with configurable latency and failure rate"""
+
+    CATEGORY_WORDS = {
+        'Education': ('school', 'classroom', 'learning'),
+        'Health': ('clinic', 'hygiene', 'toilet', 'safety gear'),
+        'Environment': ('litter', 'drain', 'dumping', 'pollution', 'deforestation', 'waste')
+    }
+    # Classification prompts also describe every category, so only the problem itself is matched
+    PROBLEM_PATTERNS = [
+        re.compile(r'Problem to classify:\s*"(.*)"\s*Provide your response', re.DOTALL),
+        re.compile(r'Vision Analysis:\s*(.*?)\s*Classify the primary issue', re.DOTALL)
+    ]
+
+    def __init__(self, latency: float = 0.5, vision_latency: Optional[float] = None,
+                 jitter: float = 0.35, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.vision_latency = latency * 2 if vision_latency is None else vision_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def generate_content(self, contents, **kwargs):
+        is_vision = isinstance(contents, list)
+        prompt = contents[0] if is_vision else contents
+        with self._lock:
+            self.calls += 1
+            # Log-normal latencies reproduce the long tail of a hosted model
+            delay = (self.vision_latency if is_vision else self.latency) * \
+                self._random.lognormvariate(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+        time.sleep(delay)
+        if failed:
+            raise Exception("503 The model is overloaded (simulated)")
+        return _FakeResponse(self._respond(prompt, is_vision))
+
+    def _respond(self, prompt: str, is_vision: bool) -> str:
+        if is_vision:
+            return ("DETECTED ISSUES:\n"
+                    "1. Littered streets (Environment) - plastic waste along the roadside. Severity: High\n"
+                    "2. Blocked drainage (Environment) - drains filled with debris. Severity: Medium\n\n"
+                    "VISUAL EVIDENCE:\nPiles of plastic bags and stagnant water near the drain.\n\n"
+                    "RECOMMENDATIONS:\nOrganize a clean-up and install covered bins.")
+        if 'PRIMARY CATEGORY' in prompt:
+            problem = self._problem_text(prompt).lower()
+            category = next((c for c, words in self.CATEGORY_WORDS.items()
+                             if any(word in problem for word in words)), Config.CATEGORIES[0])
+            return (f"PRIMARY CATEGORY: {category}\nCONFIDENCE: High\n"
+                    f"REASONING: The problem is mainly about {category.lower()} conditions.")
+        if 'MISSION STATEMENT' in prompt:
+            return ("MISSION STATEMENT: Our mission is to restore a clean, safe neighbourhood "
+                    "by working with residents to remove waste and keep drains open.\n\n"
+                    "PROJECT TITLE: Clean Streets, Healthy Homes\n\n"
+                    "KEY OBJECTIVES:\n- Map waste hotspots\n- Run monthly clean-ups\n- Track drain blockages\n\n"
+                    "EXPECTED IMPACT: Fewer floods and less disease in the area.")
+        if 'Socratic mentor guiding' in prompt:
+            return ("GUIDING QUESTIONS:\n- Who is most affected?\n- What causes the problem?\n\n"
+                    "REFLECTION PROMPTS:\n- What have you observed yourself?\n\n"
+                    "CHALLENGE POINTS:\n- Is this a symptom or the root cause?\n\n"
+                    "NEXT STEPS:\n- Interview three residents")
+        if 'template for the following problem' in prompt:
+            return ("OBJECTIVE:\nReduce waste in the area\n\nACTIVITIES:\nClean-up days\n\n"
+                    "IMPLEMENTATION GUIDE:\nStart small and document results.\n\n"
+                    "PRACTICAL TIPS:\n1. Partner with local leaders\n2. Share progress publicly")
+        return "That's a good question. What do you think would happen if you asked the people affected?"
+
+    def _problem_text(self, prompt: str) -> str:
+        for pattern in self.PROBLEM_PATTERNS:
+            match = pattern.search(prompt)
+            if match:
+                return match.group(1)
+        return prompt
+
+
+def check_backend(backend: FakeBackend, classifier) -> List[str]:
+    """Problems the fake backend classifies differently from their expected category"""
+    mismatches = []
+    for template, expected in PROBLEMS:
+        problem = template.format(place=PLACES[0])
+        prompt = classifier._create_classification_prompt(problem, use_reasoning=True)
+        category, _, _ = classifier._parse_classification(backend._respond(prompt, False))
+        if category != expected:
+            mismatches.append(f"'{problem}' -> {category}, expected {expected}")
+    return mismatches
+
+
+def install_backend(backend, platform: AILearningPlatform, mentor: AIMentor):
+    """Points every model client of the platform and mentor at the given backend, bypassing routing"""
+    for component in (platform.vision_detector, platform.problem_classifier,
+                      platform.mission_generator, platform.mentor, mentor):
+        component.model.model = backend
+        component.model.key_pool = None
+        component.model.router = None
+
+
+class LoadGenerator:
+    """Simulates concurrent app users and reports per-scenario latency, errors and memory"""
+
+    def __init__(self, platform: AILearningPlatform, mentor: AIMentor, users: int = 10,
+                 think_time: float = 1.0, repeat_rate: float = 0.0,
+                 image_dir: Optional[str] = None, seed: Optional[int] = None):
+        self.platform = platform
+        self.mentor = mentor
+        self.users = users
+        self.think_time = think_time
+        # Share of requests reusing earlier content, which the stage cache may answer
+        self.repeat_rate = repeat_rate
+        self.seed = seed
+        self.image_dir = image_dir or tempfile.mkdtemp(prefix='loadgen_')
+        self._image_count = 0
+        self._image_lock = threading.Lock()
+        self.images = [self._make_image(random.Random(index)) for index in range(max(4, users * 2))]
+
+    def run(self, mix: Dict[str, float], duration: float) -> Dict:
+        """Runs users for duration seconds, each picking scenarios by mix weight"""
+        recorder = Metrics(window=100000)
+        rss_before = _rss_mb()
+        stop_at = time.perf_counter() + duration
+
+        threads = [threading.Thread(target=self._user_loop, args=(index, mix, stop_at, recorder),
+                                    name=f"loadgen-user-{index}", daemon=True)
+                   for index in range(self.users)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        gc.collect()
+        return self._report(recorder, elapsed, _rss_mb() - rss_before)
+
+    def run_phases(self, mix: Dict[str, float], duration: float) -> Dict:
+        """Runs each scenario on its own, then the mix, so memory growth can be attributed"""
+        phases = {}
+        for scenario in mix:
+            phases[scenario] = self.run({scenario: 1}, duration)
+        phases['mixed'] = self.run(mix, duration)
+        return phases
+
+    def _user_loop(self, index: int, mix: Dict[str, float], stop_at: float, recorder: Metrics):
+        rng = random.Random(None if self.seed is None else self.seed + index)
+        scenarios, weights = list(mix), list(mix.values())
+        history = []
+
+        while time.perf_counter() < stop_at:
+            scenario = rng.choices(scenarios, weights)[0]
+            repeat = rng.random() < self.repeat_rate
+            problem = rng.choice(PROBLEMS)[0].format(place=rng.choice(PLACES))
+            if not repeat:
+                problem += f" (report #{rng.randrange(10 ** 6)})"
+            image_path = None
+            if scenario == 'image':
+                image_path = rng.choice(self.images) if repeat else self._make_image(rng)
+
+            started = time.perf_counter()
+            try:
+                result = self._run_scenario(scenario, problem, image_path, rng, history)
+                ok = bool(result.get('success'))
+            except Exception:
+                ok = False
+            recorder.observe(f"scenario.{scenario}", time.perf_counter() - started)
+            if image_path and not repeat:
+                os.remove(image_path)
+            recorder.increment(f"{scenario}.requests")
+            if not ok:
+                recorder.increment(f"{scenario}.errors")
+
+            if self.think_time:
+                time.sleep(rng.expovariate(1 / self.think_time))
+
+    def _run_scenario(self, scenario: str, problem: str, image_path: Optional[str],
+                      rng: random.Random, history: List[Dict]) -> Dict:
+        if scenario == 'text':
+            return self.platform.process_text_description(problem)
+        if scenario == 'image':
+            return self.platform.process_image(image_path)
+        if scenario == 'socratic':
+            return self.mentor.critical_thinking_mode(problem)
+        if scenario == 'solution':
+            return self.mentor.solution_mode(problem)
+        if scenario == 'chat':
+            # Each user keeps one conversation, trimmed the way a long session would be
+            message = rng.choice(CHAT_MESSAGES) if history else problem
+            mode = rng.choice(['critical_thinking', 'solution'])
+            result = self.mentor.interactive_mentoring(message, mode, history=history)
+            if result.get('success'):
+                history.extend([{'role': 'user', 'content': message},
+                                {'role': 'mentor', 'content': result['mentor_response']}])
+                del history[:-12]
+            return result
+        raise ValueError(f"Unknown scenario: {scenario}")
+
+    def _report(self, recorder: Metrics, elapsed: float, rss_growth: float) -> Dict:
+        snapshot = recorder.snapshot()
+        scenarios = {}
+        total_requests = total_errors = 0
+
+        for name, latency in snapshot['latencies'].items():
+            scenario = name.split('.', 1)[1]
+            requests = recorder.counter(f"{scenario}.requests")
+            errors = recorder.counter(f"{scenario}.errors")
+            total_requests += requests
+            total_errors += errors
+            scenarios[scenario] = {
+                'requests': requests,
+                'throughput_rps': requests / elapsed if elapsed else 0.0,
+                'error_rate': errors / requests if requests else 0.0,
+                'latency_mean': latency['mean'],
+                'latency_p50': latency['p50'],
+                'latency_p95': latency['p95'],
+                'latency_p99': latency['p99']
+            }
+
+        return {
+            'users': self.users,
+            'elapsed_seconds': elapsed,
+            'requests': total_requests,
+            'throughput_rps': total_requests / elapsed if elapsed else 0.0,
+            'error_rate': total_errors / total_requests if total_requests else 0.0,
+            'rss_growth_mb': rss_growth,
+            'scenarios': scenarios
+        }
+
+    def _make_image(self, rng: random.Random) -> str:
+        # Random noise gives every image a distinct digest and a realistic encoded size
+        with self._image_lock:
+            self._image_count += 1
+            path = os.path.join(self.image_dir, f"scene_{self._image_count}.jpg")
+        noise = bytes(rng.getrandbits(8) for _ in range(160 * 120 * 3))
+        Image.frombytes('RGB', (160, 120), noise).resize((640, 480)).save(path, quality=85)
+        return path
+
+
+def _rss_mb() -> float:
+    # Current resident set size; falls back to the peak where /proc is unavailable
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{name}', expected one of {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def format_report(report: Dict, title: str) -> str:
+    lines = [
+        f"=== {title}: {report['users']} users, {report['elapsed_seconds']:.1f}s ===",
+        f"Throughput: {report['throughput_rps']:.2f} req/s  Errors: {report['error_rate']:.1%}  "
+        f"RSS growth: {report['rss_growth_mb']:+.1f} MB",
+        f"{'scenario':<10}{'reqs':>7}{'req/s':>8}{'err':>7}{'p50':>8}{'p95':>8}{'p99':>8}"
+    ]
+    for name, stats in sorted(report['scenarios'].items()):
+        lines.append(f"{name:<10}{stats['requests']:>7}{stats['throughput_rps']:>8.2f}"
+                     f"{stats['error_rate']:>7.1%}{stats['latency_p50']:>8.2f}"
+                     f"{stats['latency_p95']:>8.2f}{stats['latency_p99']:>8.2f}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-user load test of the AI Learning Platform flows")
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=30, help="Seconds per phase")
+    parser.add_argument('--mix', default=','.join(f"{k}={v}" for k, v in DEFAULT_MIX.items()))
+    parser.add_argument('--think-time', type=float, default=1.0, help="Mean pause between user actions")
+    parser.add_argument('--repeat-rate', type=float, default=0.0,
+                        help="Share of requests repeating earlier content (cache hits)")
+    parser.add_argument('--phases', action='store_true', help="Run each scenario alone before the mix")
+    parser.add_argument('--latency', type=float, default=0.5, help="Fake backend text latency in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fake backend failure probability")
+    parser.add_argument('--live', action='store_true', help="Call the real Gemini API instead of the fake backend")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', help="Also write the report to this file")
+    args = parser.parse_args()
+
+    if not args.live:
+        Config.GEMINI_API_KEY = Config.GEMINI_API_KEY or 'load-test'
+    platform = AILearningPlatform()
+    mentor = AIMentor()
+    if not args.live:
+        backend = FakeBackend(args.latency, error_rate=args.error_rate, seed=args.seed)
+        # A backend that misclassifies skews speculation hit rates and text-flow latency
+        mismatches = check_backend(backend, platform.problem_classifier)
+        if mismatches:
+            parser.error("fake backend misclassifies: " + '; '.join(mismatches))
+        install_backend(backend, platform, mentor)
+
+    generator = LoadGenerator(platform, mentor, args.users, args.think_time,
+                              args.repeat_rate, seed=args.seed)
+    mix = parse_mix(args.mix)
+    # The pipeline reports progress with print; keep it out of the report
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if args.phases:
+            reports = generator.run_phases(mix, args.duration)
+        else:
+            reports = {'mixed': generator.run(mix, args.duration)}
+
+    for title, report in reports.items():
+        print(format_report(report, title))
+        print()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+        print(f"Report saved to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
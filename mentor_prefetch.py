@@ -0,0 +1,125 @@
+import atexit
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+from config import Config
+from metrics import metrics
+from model_client import in_flight_calls
+
+
+class SolutionPrefetcher:
+    """Generates the likely next Solution-mode answer in the background and holds it briefly"""
+
+    def __init__(self, ttl: Optional[float] = None, budget_per_minute: Optional[int] = None,
+                 max_entries: Optional[int] = None):
+        self.ttl = ttl or Config.PREFETCH_TTL_SECONDS
+        self.budget_per_minute = budget_per_minute or Config.PREFETCH_BUDGET_PER_MINUTE
+        self.max_entries = max_entries or Config.PREFETCH_MAX_ENTRIES
+        # One worker: prefetches queue behind each other instead of competing with live calls
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch')
+        self._entries: OrderedDict = OrderedDict()
+        self._spent = deque()
+        self._lock = threading.Lock()
+        self.stats = {'scheduled': 0, 'skipped_budget': 0, 'skipped_busy': 0,
+                      'hits': 0, 'misses': 0, 'expired': 0, 'failed': 0}
+        self._closed = False
+        # Speculative calls are worthless once the process is going away
+        atexit.register(self.shutdown)
+
+    def schedule(self, mentor, problem_description: str, category: Optional[str] = None) -> bool:
+        """Starts solution generation for the auto-detected template; False when skipped"""
+        template_type = mentor._determine_template_type(problem_description, category)
+        key = self._key(problem_description, template_type, category)
+        now = time.monotonic()
+
+        with self._lock:
+            if self._closed:
+                return False
+            self._evict(now)
+            if key in self._entries:
+                return True
+            if in_flight_calls() >= Config.PREFETCH_MAX_LIVE_CALLS:
+                self.stats['skipped_busy'] += 1
+                return False
+            while self._spent and now - self._spent[0] >= 60:
+                self._spent.popleft()
+            if len(self._spent) >= self.budget_per_minute:
+                self.stats['skipped_budget'] += 1
+                return False
+
+            self._spent.append(now)
+            self.stats['scheduled'] += 1
+            future = self._executor.submit(mentor._generate_solution, problem_description,
+                                           template_type, category)
+            self._entries[key] = (now + self.ttl, future)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+        metrics.increment('prefetch.scheduled')
+        return True
+
+    def take(self, problem_description: str, template_type: str,
+             category: Optional[str] = None) -> Optional[Dict]:
+        """The prefetched result for this request, waiting for it only if already running"""
+        key = self._key(problem_description, template_type, category)
+        with self._lock:
+            self._evict(time.monotonic())
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.stats['misses'] += 1
+        if entry is None:
+            metrics.increment('prefetch.misses')
+            return None
+
+        future: Future = entry[1]
+        # Still queued behind other prefetches: the live call is faster than waiting
+        if not future.running() and future.cancel():
+            with self._lock:
+                self.stats['misses'] += 1
+            metrics.increment('prefetch.misses')
+            return None
+        try:
+            result = future.result()
+        except Exception:
+            result = None
+        if not result or not result.get('success'):
+            with self._lock:
+                self.stats['failed'] += 1
+            return None
+
+        with self._lock:
+            self.stats['hits'] += 1
+        metrics.increment('prefetch.hits')
+        return dict(result, prefetched=True)
+
+    def shutdown(self):
+        """Drops held results and cancels queued prefetches; a running one is left to finish"""
+        with self._lock:
+            self._closed = True
+            for key in list(self._entries):
+                self._drop(key)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def report(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        # Share of spent prefetches that a user actually consumed
+        stats['precision'] = stats['hits'] / stats['scheduled'] if stats['scheduled'] else 0.0
+        return stats
+
+    def _evict(self, now: float):
+        for key in [key for key, (expires, _) in self._entries.items() if expires <= now]:
+            self._drop(key)
+            self.stats['expired'] += 1
+
+    def _drop(self, key):
+        _, future = self._entries.pop(key)
+        future.cancel()
+
+    @staticmethod
+    def _key(problem_description: str, template_type: str, category: Optional[str]) -> tuple:
+        # Users retype the problem into the Solution box, so spacing and case are ignored
+        return ' '.join(problem_description.lower().split()), template_type, category
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+
+class Metrics:
+    """Thread-safe counters and latency summaries shared by the pipeline and services"""
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self.started_at = time.time()
+        self._counters = {}
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            if name not in self._latencies:
+                self._latencies[name] = {'count': 0, 'total': 0.0, 'recent': deque(maxlen=self.window)}
+            summary = self._latencies[name]
+            summary['count'] += 1
+            summary['total'] += seconds
+            summary['recent'].append(seconds)
+
+    def timer(self, name: str) -> '_Timer':
+        return _Timer(self, name)
+
+    def counter(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            latencies = {}
+            for name, summary in self._latencies.items():
+                recent = sorted(summary['recent'])
+                latencies[name] = {
+                    'count': summary['count'],
+                    'mean': summary['total'] / summary['count'],
+                    'p50': self._percentile(recent, 50),
+                    'p95': self._percentile(recent, 95),
+                    'p99': self._percentile(recent, 99)
+                }
+            return {
+                'uptime_seconds': time.time() - self.started_at,
+                'counters': dict(self._counters),
+                'latencies': latencies
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._latencies.clear()
+
+    @staticmethod
+    def _percentile(ordered, percent: float) -> float:
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class _Timer:
+
+    def __init__(self, metrics: Metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.started)
+        if exc_type is not None:
+            self.metrics.increment(f"{self.name}.errors")
+
+
+# Process-wide registry
+metrics = Metrics()
@@ -1,6 +1,7 @@
 from typing import Optional, Dict
 import google.generativeai as genai
 from config import Config
+from model_client import ModelClient
 
 
 class MissionStatementGenerator:
@@ -9,7 +10,7 @@ class MissionStatementGenerator:
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key or Config.GEMINI_API_KEY
         genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel(Config.TEXT_MODEL)
+        self.model = ModelClient(Config.TEXT_MODEL, stage='mission')
     
     def generate_mission_statement(self, problem_description: str, 
                                    context: Optional[str] = None) -> Dict:
@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+import google.generativeai as genai
+from config import Config
+from key_pool import ApiKeyPool, default_key_pool
+from metrics import metrics
+from model_router import default_router
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls so every caller shares one in-flight execution
+
+    Threads and asyncio tasks join the same flights, because both wait on the
+    same concurrent.futures.Future.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, func: Callable):
+        flight, leader = self._join(key)
+        if leader:
+            self._lead(key, flight, func)
+        return flight.result()
+
+    async def do_async(self, key: str, func: Callable):
+        flight, leader = self._join(key)
+        if leader:
+            # The blocking call runs off the event loop; followers only await the future
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._lead, key, flight, func)
+        return await asyncio.wrap_future(flight)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                metrics.increment('model.coalesced')
+                return flight, False
+            flight = Future()
+            self._flights[key] = flight
+            return flight, True
+
+    def _lead(self, key: str, flight: Future, func: Callable):
+        try:
+            flight.set_result(func())
+        except BaseException as e:
+            flight.set_exception(e)
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+
+# Shared by every ModelClient so identical requests coalesce across components
+_single_flight = SingleFlight()
+
+# Last use of each connection: None is the default genai client, keys name pooled clients
+_channel_last_used: Dict[Optional[str], float] = {}
+_channel_lock = threading.Lock()
+
+
+def _touch_channel(channel: Optional[str]) -> bool:
+    """Marks the channel used now; True when it was new or idle long enough to be cold"""
+    now = time.monotonic()
+    with _channel_lock:
+        last = _channel_last_used.get(channel)
+        _channel_last_used[channel] = now
+    return last is None or now - last > Config.CHANNEL_COLD_SECONDS
+
+
+def in_flight_calls() -> int:
+    """Distinct model requests currently outstanding across every client"""
+    return _single_flight.in_flight()
+
+
+def channel_idle_seconds(channel: Optional[str]) -> Optional[float]:
+    with _channel_lock:
+        last = _channel_last_used.get(channel)
+    return None if last is None else time.monotonic() - last
+
+
+class ModelClient:
+    """Model-call path shared by the detector, classifier, mission generator and mentor"""
+
+    def __init__(self, model_name: str, key_pool: Optional[ApiKeyPool] = None,
+                 stage: Optional[str] = None):
+        # With routing on, a stage's chain picks the model per call; stage sets the default
+        self.stage = stage
+        self.router = default_router()
+        self.model_name = self.router.primary(stage) if self.router and stage else model_name
+        self.model = genai.GenerativeModel(self.model_name)
+        # With several API keys each call goes out on the key with the most headroom
+        self.key_pool = key_pool or default_key_pool()
+        self._models = {}
+
+    def generate_content(self, contents, stage: Optional[str] = None, **kwargs):
+        stage = stage or self.stage
+        # Streaming responses can only be consumed once, so they are never shared
+        if kwargs.get('stream'):
+            return self.model.generate_content(contents, **kwargs)
+        return _single_flight.do(self._request_key(contents, stage, kwargs),
+                                 lambda: self._call(contents, stage, kwargs))
+
+    async def generate_content_async(self, contents, stage: Optional[str] = None, **kwargs):
+        stage = stage or self.stage
+        return await _single_flight.do_async(self._request_key(contents, stage, kwargs),
+                                             lambda: self._call(contents, stage, kwargs))
+
+    def _call(self, contents, stage: Optional[str], kwargs: Dict):
+        metrics.increment('model.calls')
+        if self.router is None or stage not in self.router.routes:
+            return self._send(self.model_name, contents, kwargs)
+        return self.router.call(stage, lambda model_name: self._send(model_name, contents, kwargs))
+
+    def _send(self, model_name: str, contents, kwargs: Dict):
+        if self.key_pool is None:
+            return self._generate(model_name, None, contents, kwargs)
+        
+        # A rate-limited key hands the call to the next one instead of failing it
+        for attempt in range(len(self.key_pool.keys)):
+            state = self.key_pool.acquire()
+            try:
+                response = self._generate(model_name, state, contents, kwargs)
+            except Exception as e:
+                self.key_pool.release(state, e)
+                if not self.key_pool.is_rate_limit(e) or attempt == len(self.key_pool.keys) - 1:
+                    raise
+                continue
+            self.key_pool.release(state)
+            return response
+
+    def _generate(self, model_name: str, state, contents, kwargs: Dict):
+        model = self._model(model_name, state)
+        if state is not None and model._client is not state.client:
+            # Sending anyway would bill the global default key, not the one the pool picked
+            raise RuntimeError(f"Model {model_name} is not bound to API key {state.label}")
+        # Calls on a channel that sat idle pay for reconnecting, so they are timed apart
+        temperature = 'cold' if _touch_channel(state.key if state else None) else 'warm'
+        with metrics.timer(f"model.{model_name}"), metrics.timer(f"model.{temperature}_call"):
+            return model.generate_content(contents, **kwargs)
+
+    def channels(self) -> List[Tuple[Optional[str], object]]:
+        """(channel, model) pairs covering every connection this client sends on"""
+        if self.key_pool is None:
+            return [(None, self.model)]
+        return [(state.key, self._model(self.model_name, state)) for state in self.key_pool.keys]
+
+    def ping(self, channel: Optional[str], model) -> float:
+        """Opens or refreshes a channel with a count_tokens call, which generates nothing"""
+        started = time.perf_counter()
+        model.count_tokens('ping')
+        elapsed = time.perf_counter() - started
+        _touch_channel(channel)
+        return elapsed
+
+    def _model(self, model_name: str, state=None):
+        if state is None and model_name == self.model_name:
+            return self.model
+        key = (model_name, state.key if state else None)
+        model = self._models.get(key)
+        if model is None:
+            model = genai.GenerativeModel(model_name)
+            if state is not None:
+                # The SDK has no public per-model client, so the key's client replaces the
+                # lazily created default (google-generativeai is pinned for this)
+                if getattr(model, '_client', False) is not None:
+                    raise RuntimeError("This google-generativeai version cannot take a per-key "
+                                       "client; pin the version in requirements.txt")
+                model._client = state.client
+            self._models[key] = model
+        return model
+
+    def _request_key(self, contents, stage: Optional[str], kwargs: Dict) -> str:
+        digest = hashlib.sha256(f"{self.model_name}:{stage}".encode())
+        self._update_digest(digest, contents)
+        digest.update(repr(sorted(kwargs.items())).encode())
+        return digest.hexdigest()
+
+    def _update_digest(self, digest, value):
+        if isinstance(value, str):
+            digest.update(b's' + value.encode())
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            digest.update(b'b' + bytes(value))
+        elif isinstance(value, (list, tuple)):
+            digest.update(b'[')
+            for item in value:
+                self._update_digest(digest, item)
+            digest.update(b']')
+        elif isinstance(value, dict):
+            for key in sorted(value):
+                digest.update(str(key).encode())
+                self._update_digest(digest, value[key])
+        elif hasattr(value, 'tobytes') and hasattr(value, 'size'):
+            self._update_image_digest(digest, value)
+        else:
+            digest.update(repr(value).encode())
+
+    def _update_image_digest(self, digest, image):
+        # Hashing every pixel of a 12MP photo costs ~80ms, so images are keyed more cheaply
+        digest.update(f"img:{image.mode}:{image.size}".encode())
+        path = getattr(image, 'filename', None)
+        if path:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            if stat:
+                # An image still backed by its file is identified by that file and frame
+                digest.update(f"file:{path}:{stat.st_size}:{stat.st_mtime_ns}:{image.tell()}".encode())
+                return
+        # Derived images (converted keyframes) fall back to a small thumbnail
+        digest.update(image.resize((64, 64), reducing_gap=2.0).tobytes())
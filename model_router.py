@@ -0,0 +1,143 @@
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from google.api_core import exceptions as api_exceptions
+from config import Config
+from metrics import metrics
+
+
+class ModelStats:
+    """Exponentially weighted latency and error rate of one model on one stage"""
+
+    def __init__(self):
+        self.latency = None
+        self.error_rate = 0.0
+        self.samples = 0
+        self.selected = 0
+
+    def record(self, seconds: float, error: bool, alpha: float):
+        self.samples += 1
+        self.error_rate += alpha * ((1.0 if error else 0.0) - self.error_rate)
+        # Failed calls often return early, so only successes say how fast the model is
+        if not error:
+            self.latency = seconds if self.latency is None else self.latency + alpha * (seconds - self.latency)
+
+
+class ModelRouter:
+    """Picks a model per stage from its fallback chain using live latency and error measurements"""
+
+    def __init__(self, routes: Optional[Dict[str, List[str]]] = None,
+                 latency_targets: Optional[Dict[str, float]] = None):
+        routes = routes or Config.STAGE_ROUTES
+        # Chains are written as tiers so upgrading a tier's model is a one-line change
+        self.routes = {stage: [Config.MODEL_TIERS.get(tier, tier) for tier in chain]
+                       for stage, chain in routes.items()}
+        self.latency_targets = latency_targets or Config.STAGE_LATENCY_TARGETS
+        self._stats: Dict[tuple, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def primary(self, stage: str) -> str:
+        return self.routes[stage][0]
+
+    def choose(self, stage: str, exclude: tuple = ()) -> Optional[str]:
+        """The first model in the chain that is healthy and within the stage's latency target"""
+        chain = [model for model in self.routes[stage] if model not in exclude]
+        if not chain:
+            return None
+
+        with self._lock:
+            stats = {model: self._get(stage, model) for model in chain}
+            # Occasionally try another model so a recovered one gets measured again
+            if len(chain) > 1 and random.random() < Config.ROUTER_PROBE_RATE:
+                choice = random.choice(chain[1:])
+            else:
+                choice = next((model for model in chain if self._acceptable(stage, stats[model])), None)
+                if choice is None:
+                    choice = min(chain, key=lambda model: self._score(stats[model]))
+            stats[choice].selected += 1
+            return choice
+
+    def call(self, stage: str, send: Callable[[str], object]):
+        """Calls send(model_name), falling back along the chain when a model fails retryably"""
+        tried, last_error = [], None
+        while True:
+            model = self.choose(stage, tuple(tried))
+            if model is None:
+                raise last_error or ValueError(f"No models routed for stage '{stage}'")
+            tried.append(model)
+
+            started = time.perf_counter()
+            try:
+                result = send(model)
+            except Exception as e:
+                # A bad request fails on every model and says nothing about this one's health
+                if not self.is_retryable(e):
+                    raise
+                self.record(stage, model, time.perf_counter() - started, error=True)
+                last_error = e
+                if len(tried) < len(self.routes[stage]):
+                    metrics.increment(f"router.{stage}.fallbacks")
+                continue
+            self.record(stage, model, time.perf_counter() - started, error=False)
+            return result
+
+    @staticmethod
+    def is_retryable(error: BaseException) -> bool:
+        """Rate limits, server errors and timeouts, which another model may not hit"""
+        if isinstance(error, (api_exceptions.TooManyRequests, api_exceptions.ServerError,
+                              TimeoutError, ConnectionError)):
+            return True
+        return re.match(r'\s*(429|5\d\d)\b', str(error)) is not None
+
+    def record(self, stage: str, model: str, seconds: float, error: bool):
+        with self._lock:
+            self._get(stage, model).record(seconds, error, Config.ROUTER_EWMA_ALPHA)
+
+    def report(self) -> Dict:
+        with self._lock:
+            return {stage: {
+                'latency_target': self.latency_targets.get(stage),
+                'models': [{
+                    'model': model,
+                    'latency': self._get(stage, model).latency,
+                    'error_rate': self._get(stage, model).error_rate,
+                    'samples': self._get(stage, model).samples,
+                    'selected': self._get(stage, model).selected
+                } for model in chain]
+            } for stage, chain in self.routes.items()}
+
+    def _get(self, stage: str, model: str) -> ModelStats:
+        key = (stage, model)
+        if key not in self._stats:
+            self._stats[key] = ModelStats()
+        return self._stats[key]
+
+    def _acceptable(self, stage: str, stats: ModelStats) -> bool:
+        # Unmeasured models get the benefit of the doubt
+        if stats.error_rate > Config.ROUTER_MAX_ERROR_RATE:
+            return False
+        target = self.latency_targets.get(stage)
+        return stats.latency is None or target is None or stats.latency <= target
+
+    @staticmethod
+    def _score(stats: ModelStats) -> float:
+        # Expected time to a good answer when every model misses its targets
+        latency = stats.latency if stats.latency is not None else 0.0
+        return latency / max(0.05, 1.0 - stats.error_rate)
+
+
+_default_router = None
+_default_router_lock = threading.Lock()
+
+
+def default_router() -> Optional[ModelRouter]:
+    """The process-wide router, or None when Config.MODEL_ROUTING is off"""
+    global _default_router
+    if not Config.MODEL_ROUTING:
+        return None
+    with _default_router_lock:
+        if _default_router is None:
+            _default_router = ModelRouter()
+        return _default_router
@@ -1,6 +1,10 @@
 from typing import Dict, Optional, List
 import google.generativeai as genai
 from config import Config
+from issue_extractor import IssueExtractor
+from metrics import metrics
+from model_client import ModelClient
+from prompt_compaction import PromptCompactor
 
 
 class ProblemClassifier:
@@ -9,8 +13,10 @@ class ProblemClassifier:
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key or Config.GEMINI_API_KEY
         genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel(Config.TEXT_MODEL)
+        self.model = ModelClient(Config.TEXT_MODEL, stage='classify')
         self.categories = Config.CATEGORIES
+        self.issue_extractor = IssueExtractor()
+        self.compactor = PromptCompactor()
     
     def classify_problem(self, problem_description: str, 
                         use_reasoning: bool = True) -> Dict:
@@ -40,14 +46,28 @@ class ProblemClassifier:
                 'problem_description': problem_description
             }
     
-    def classify_with_vision_analysis(self, vision_analysis: str) -> Dict:
+    def classify_with_vision_analysis(self, vision_analysis: str,
+                                      local: Optional[bool] = None) -> Dict:
+        use_local = Config.LOCAL_CLASSIFICATION if local is None else local
+        if use_local:
+            issues = self.issue_extractor.extract(vision_analysis)
+            decision = self.issue_extractor.derive_category(issues)
+            if not decision['ambiguous']:
+                metrics.increment('classify.local')
+                return self._local_classification(issues, decision)
+            metrics.increment('classify.model_fallback')
+        
+        # The model only needs the detected issues, not the whole analysis
+        compaction = self.compactor.compact(vision_analysis, 'classification')
+        metrics.increment('compaction.tokens_saved', compaction['saved_tokens'])
+        
         prompt = f"""You are an expert classifier that categorizes community problems into 
 three domains: Environment, Health, and Education. You provide accurate classifications with clear reasoning.
 
 Based on the following vision analysis of a community problem image, classify the primary problem category:
 
 Vision Analysis:
-{vision_analysis}
+{compaction['text']}
 
 Classify the primary issue into one of these categories:
 - Environment
@@ -71,7 +91,8 @@ If multiple categories apply, choose the most dominant one."""
                 'category': category,
                 'confidence': confidence,
                 'reasoning': reasoning,
-                'source': 'vision_analysis'
+                'source': 'vision_analysis',
+                'compaction': PromptCompactor.stats(compaction)
             }
             
         except Exception as e:
@@ -80,6 +101,25 @@ If multiple categories apply, choose the most dominant one."""
                 'error': str(e)
             }
     
+    def _local_classification(self, issues: List[Dict], decision: Dict) -> Dict:
+        category = decision['category']
+        supporting = [issue for issue in issues if issue['domain'] == category]
+        named = sorted({issue['issue'] for issue in supporting if issue['issue']})
+        
+        reasoning = (f"Derived from the detected issues: {len(supporting)} of {len(issues)} "
+                     f"point to {category} ({decision['share']:.0%} of severity-weighted score)")
+        if named:
+            reasoning += f", including {', '.join(named)}"
+        
+        return {
+            'success': True,
+            'category': category,
+            'confidence': 'High' if decision['share'] >= 0.8 else 'Medium',
+            'reasoning': reasoning + '.',
+            'source': 'local_extraction',
+            'issues': issues
+        }
+    
     def _create_classification_prompt(self, problem_description: str, 
                                      use_reasoning: bool) -> str:
         categories_desc = self._get_category_descriptions()
@@ -0,0 +1,197 @@
+import contextvars
+import cProfile
+import functools
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional
+from config import Config
+
+# The session of the run being profiled, inherited by stage worker threads
+_current_session = contextvars.ContextVar('profile_session', default=None)
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+
+
+class ProfileSession:
+    """CPU and allocation data collected for one sampled run"""
+
+    def __init__(self, run_name: str):
+        self.run_name = run_name
+        self.run_id = uuid.uuid4().hex[:8]
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.report_path = None
+        self.skipped_threads = 0
+        self._profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def add(self, profile: cProfile.Profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def stats(self) -> Optional[pstats.Stats]:
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+
+class RunProfiler:
+    """Opt-in cProfile and tracemalloc capture of pipeline runs, sampled and saved to disk"""
+
+    def __init__(self, output_dir: Optional[str] = None, sample_rate: Optional[float] = None,
+                 top_n: Optional[int] = None):
+        self.output_dir = output_dir or Config.PROFILE_DIR
+        self.sample_rate = Config.PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.top_n = top_n or Config.PROFILE_TOP_N
+
+    @contextmanager
+    def session(self, run_name: str, profile_caller: bool = True):
+        """Profiles the enclosed run when sampled; yields the session or None
+
+        With profile_caller=False the session is not made current for the caller;
+        the runner activates it around each stage with active_session(). Generators
+        need this, since the consumer runs in their context between yields.
+        """
+        # Nested runs (process_image inside a profiled request) join the outer session
+        if _current_session.get() is not None or random.random() >= self.sample_rate:
+            yield None
+            return
+
+        session = ProfileSession(run_name)
+        token = _current_session.set(session) if profile_caller else None
+        _start_tracemalloc()
+        try:
+            if profile_caller:
+                with _profile_thread(session):
+                    yield session
+            else:
+                yield session
+        finally:
+            if token is not None:
+                _current_session.reset(token)
+            session.elapsed = time.perf_counter() - session.started
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            _stop_tracemalloc()
+            session.report_path = self._write_report(session, snapshot, peak)
+
+    def _write_report(self, session: ProfileSession, snapshot, peak: int) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        base = os.path.join(self.output_dir, f"{stamp}-{session.run_name}-{session.run_id}")
+
+        out = io.StringIO()
+        out.write(f"Run: {session.run_name} ({session.run_id})\n")
+        out.write(f"Wall time: {session.elapsed:.3f}s\n")
+        out.write(f"Peak traced memory: {peak / 1024:.1f} KiB\n")
+        if session.skipped_threads:
+            out.write(f"Threads not profiled (profiler busy): {session.skipped_threads}\n")
+
+        stats = session.stats()
+        if stats is not None:
+            stats.dump_stats(base + '.prof')
+            for order in ('cumulative', 'tottime'):
+                out.write(f"\n=== Top {self.top_n} functions by {order} time ===\n")
+                stats.stream = out
+                stats.sort_stats(order).print_stats(self.top_n)
+
+        # tracemalloc is process-wide, so concurrent runs share these sites
+        out.write(f"\n=== Top {self.top_n} allocation sites ===\n")
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        for stat in snapshot.filter_traces(filters).statistics('lineno')[:self.top_n]:
+            out.write(f"{stat}\n")
+
+        with open(base + '.txt', 'w') as f:
+            f.write(out.getvalue())
+        print(f"Profile report saved to {base}.txt")
+        return base + '.txt'
+
+
+@contextmanager
+def active_session(session: Optional[ProfileSession]):
+    """Makes session current for the enclosed block; a no-op for None"""
+    if session is None:
+        yield
+        return
+    token = _current_session.set(session)
+    try:
+        yield
+    finally:
+        _current_session.reset(token)
+
+
+def profiled_call(func, *args, **kwargs):
+    """Runs func, profiling this thread into the active session when there is one"""
+    session = _current_session.get()
+    if session is None:
+        return func(*args, **kwargs)
+    with _profile_thread(session):
+        return func(*args, **kwargs)
+
+
+def profiled(run_name: str):
+    """Method decorator: profiles the call through self.profiler when one is configured"""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            profiler = getattr(self, 'profiler', None)
+            if profiler is None:
+                return method(self, *args, **kwargs)
+            with profiler.session(run_name) as session:
+                result = method(self, *args, **kwargs)
+            if session is not None and isinstance(result, dict):
+                result['profile_report'] = session.report_path
+            return result
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def _profile_thread(session: ProfileSession):
+    # A nested enable() would replace the outer profiler's hook, and its disable() would
+    # leave the thread unprofiled; the outer profile already covers this work
+    if sys.getprofile() is not None:
+        session.skipped_threads += 1
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        session.add(profile)
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(Config.PROFILE_TRACEBACK_DEPTH)
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        # Tracing started by someone else is left running
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
@@ -0,0 +1,166 @@
+import re
+from typing import Dict, List, Optional
+from config import Config
+from issue_extractor import IssueExtractor
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Local estimate of model tokens: one per punctuation mark, one per ~4 characters of a word"""
+    return sum((len(piece) + 3) // 4 for piece in _TOKEN.findall(text))
+
+
+class PromptCompactor:
+    """Shrinks a vision analysis to a stage's token budget, keeping issues and severities first"""
+
+    SEVERITY_ORDER = {'High': 0, 'Medium': 1, 'Low': 2}
+
+    # Pleasantries and markdown that carry no signal for the next model call
+    _BOILERPLATE = re.compile(
+        r"^(?:here(?:'s| is| are)\b.*|based on (?:the|this|my) (?:image|analysis)\b.*:|"
+        r"i hope\b.*|let me know\b.*|overall,?\s*$|(?:-{3,}|\*{3,}|_{3,}|#+)\s*$)",
+        re.IGNORECASE)
+    _MARKDOWN = re.compile(r'\*\*|__|`|^#+\s*|^\s*(?:\d+[.)]|[-*•])\s+', re.MULTILINE)
+    _DOMAIN_LABEL = re.compile(r'\s*(?:\(\s*(?:{0})\s*\)|\b(?:domain|category)\s*:\s*(?:{0})\b)[.,;]?|'
+                               r'[-–—]\s*(?:{0})\s*(?=[-–—])'.format('|'.join(Config.CATEGORIES)),
+                               re.IGNORECASE)
+    _SEVERITY_LABEL = re.compile(r'[\s,;.(-]*\bseverity(?:\s+level)?\s*[:\-]?\s*(?:high|medium|low)\b\)?[.,;]?',
+                                 re.IGNORECASE)
+    _FIELD_NAME = re.compile(r'[\s.;]*\b(?:issue|description|location|impact)\s*:\s*', re.IGNORECASE)
+
+    def __init__(self, budgets: Optional[Dict[str, int]] = None):
+        self.budgets = budgets or Config.STAGE_INPUT_BUDGETS
+        self.extractor = IssueExtractor()
+
+    def compact(self, vision_analysis: str, stage: str) -> Dict:
+        budget = self.budgets[stage]
+        original_tokens = count_tokens(vision_analysis)
+        issues = self.extractor.extract(vision_analysis)
+
+        if issues:
+            text, kept = self._compact_issues(vision_analysis, issues, budget)
+        else:
+            # Unstructured analysis: keep the prose minus recommendations and boilerplate
+            text, kept = self._fit_lines(self._clean_lines(self._before(vision_analysis, 'RECOMMENDATIONS:')),
+                                         budget), 0
+
+        tokens = count_tokens(text)
+        return {
+            'text': text,
+            'budget': budget,
+            'original_tokens': original_tokens,
+            'tokens': tokens,
+            'saved_tokens': max(0, original_tokens - tokens),
+            'issues_kept': kept,
+            'issues_total': len(issues)
+        }
+
+    @staticmethod
+    def stats(compaction: Dict) -> Dict:
+        """The compaction without its text, for attaching to results"""
+        return {key: value for key, value in compaction.items() if key != 'text'}
+
+    def _compact_issues(self, vision_analysis: str, issues: List[Dict], budget: int):
+        # Highest severity first, so the budget cuts the least important issues
+        ranked = sorted(issues, key=lambda issue: self.SEVERITY_ORDER.get(issue['severity'], 3))
+        lines = ['DETECTED ISSUES:']
+        used = count_tokens(lines[0])
+
+        kept = 0
+        for issue in ranked:
+            line = self._issue_line(issue)
+            cost = count_tokens(line)
+            if used + cost > budget:
+                if kept == 0:
+                    line = self._issue_line(issue, budget - used)
+                    lines.append(line)
+                    used += count_tokens(line)
+                    kept = 1
+                break
+            lines.append(line)
+            used += cost
+            kept += 1
+
+        if kept < len(ranked):
+            note = f"(+{len(ranked) - kept} lower-severity issues omitted)"
+            if used + count_tokens(note) <= budget:
+                lines.append(note)
+                used += count_tokens(note)
+
+        # Leftover budget goes to the visual evidence; recommendations are never forwarded
+        evidence = self._clean_lines(self._section(vision_analysis, 'VISUAL EVIDENCE:', 'RECOMMENDATIONS:'))
+        remaining = budget - used - count_tokens('VISUAL EVIDENCE:')
+        if evidence and remaining > 8:
+            fitted = self._fit_lines(evidence, remaining)
+            if fitted:
+                lines += ['', 'VISUAL EVIDENCE:', fitted]
+
+        return '\n'.join(lines), kept
+
+    def _issue_line(self, issue: Dict, max_tokens: Optional[int] = None) -> str:
+        text = ' '.join(self._MARKDOWN.sub('', line).strip() for line in issue['text'].split('\n'))
+        text = self._SEVERITY_LABEL.sub('', self._DOMAIN_LABEL.sub('', text))
+        text = self._FIELD_NAME.sub('; ', re.sub(r'\s+', ' ', text)).strip(' -–—:;,')
+
+        # Domain and severity are restated in one place the issue extractor can parse again
+        labels = []
+        if issue['domain']:
+            labels.append(f"Domain: {issue['domain']}")
+        if issue['severity']:
+            labels.append(f"Severity: {issue['severity']}")
+        suffix = ''.join(f" | {label}" for label in labels)
+        if max_tokens is not None:
+            text = self._truncate(text, max_tokens - count_tokens('- ' + suffix))
+        return '- ' + text + suffix
+
+    def _clean_lines(self, text: str) -> List[str]:
+        lines = []
+        for line in text.split('\n'):
+            line = re.sub(r'\s+', ' ', self._MARKDOWN.sub('', line)).strip()
+            if line and not self._BOILERPLATE.match(line) and not line.endswith(':'):
+                lines.append(line)
+        return lines
+
+    def _fit_lines(self, lines: List[str], budget: int) -> str:
+        kept, used = [], 0
+        for line in lines:
+            cost = count_tokens(line)
+            if used + cost > budget:
+                if budget - used > 8:
+                    kept.append(self._truncate(line, budget - used))
+                break
+            kept.append(line)
+            used += cost
+        return '\n'.join(kept)
+
+    def _truncate(self, text: str, budget: int) -> str:
+        # Cut at a word boundary, preferring the end of a sentence
+        words, used, kept = text.split(' '), 0, []
+        for word in words:
+            cost = count_tokens(word)
+            if used + cost > budget - 1:
+                break
+            kept.append(word)
+            used += cost
+        cut = ' '.join(kept)
+        if len(kept) == len(words):
+            return cut
+        sentence_end = cut.rfind('. ')
+        if sentence_end > len(cut) // 2:
+            return cut[:sentence_end + 1]
+        return cut.rstrip(' ,;:') + '…'
+
+    @staticmethod
+    def _section(text: str, header: str, next_header: str) -> str:
+        start = text.find(header)
+        if start == -1:
+            return ''
+        start += len(header)
+        end = text.find(next_header, start)
+        return text[start:end if end != -1 else len(text)]
+
+    @staticmethod
+    def _before(text: str, header: str) -> str:
+        end = text.find(header)
+        return text if end == -1 else text[:end]
@@ -0,0 +1,49 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import Config
+
+
+class ResultCache:
+    """Bounded LRU cache of pipeline results keyed by content hash and mode"""
+    
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or Config.RESULT_CACHE_SIZE
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(content: bytes, mode: str) -> str:
+        return f"{mode}:{hashlib.sha256(content).hexdigest()}"
+    
+    def get(self, key: Optional[str]) -> Optional[Dict]:
+        with self._lock:
+            if key is None or key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+    
+    def put(self, key: str, result: Dict):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            # Evict least recently used results beyond the bound
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,51 @@
+from dataclasses import dataclass, fields
+from typing import Any, Dict, List, Optional
+
+
+class DictCompatible:
+    """Gives slotted result dataclasses the dict interface existing callers use"""
+    
+    __slots__ = ()
+    
+    def __getitem__(self, key: str):
+        if key not in self:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def __setitem__(self, key: str, value):
+        if key not in self.__slots__:
+            raise KeyError(f"{type(self).__name__} has no field '{key}'")
+        setattr(self, key, value)
+    
+    def __contains__(self, key: str) -> bool:
+        # Unset optional fields behave like missing dict keys
+        return key in self.__slots__ and getattr(self, key) is not None
+    
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self else default
+    
+    def keys(self) -> List[str]:
+        return [f.name for f in fields(self) if getattr(self, f.name) is not None]
+    
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+    
+    def to_dict(self) -> Dict:
+        return dict(self.items())
+
+
+@dataclass(slots=True)
+class VisionResult(DictCompatible):
+    """Outcome of one vision detection call, without SDK objects unless requested"""
+    
+    success: bool
+    domains_analyzed: List[str]
+    analysis: Optional[str] = None
+    error: Optional[str] = None
+    image_path: Optional[str] = None
+    image_digest: Optional[str] = None
+    packed: Optional[bool] = None
+    frames_analyzed: Optional[List[int]] = None
+    frame_count: Optional[int] = None
+    quality: Optional[Dict] = None
+    raw_response: Optional[Any] = None
@@ -0,0 +1,183 @@
+import atexit
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Union
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from config import Config
+
+
+class ResultsStore:
+    """Append-optimized columnar store of pipeline results, written as partitioned Parquet"""
+
+    SCHEMA = pa.schema([
+        ('recorded_at', pa.timestamp('us', tz='UTC')),
+        ('source', pa.string()),
+        ('success', pa.bool_()),
+        ('failed_step', pa.string()),
+        ('image_path', pa.string()),
+        ('original_description', pa.string()),
+        ('confidence', pa.string()),
+        ('classification_source', pa.string()),
+        ('reasoning', pa.string()),
+        ('high_severity_count', pa.int16()),
+        ('medium_severity_count', pa.int16()),
+        ('low_severity_count', pa.int16()),
+        ('max_severity', pa.string()),
+        ('mission_statement', pa.string()),
+        ('problem_definition', pa.string()),
+        ('goal', pa.string()),
+        ('expected_impact', pa.string()),
+        ('action_steps', pa.list_(pa.string())),
+        ('action_step_count', pa.int16()),
+        ('speculation_hit', pa.bool_()),
+        ('vision_analysis', pa.string())
+    ])
+
+    # Hive-style directories: date=YYYY-MM-DD/category=<name>/part-*.parquet
+    PARTITIONING = ds.partitioning(
+        pa.schema([('date', pa.string()), ('category', pa.string())]),
+        flavor='hive'
+    )
+
+    SEVERITIES = ('High', 'Medium', 'Low')
+
+    def __init__(self, root_dir: Optional[str] = None, flush_rows: Optional[int] = None,
+                 flush_seconds: Optional[float] = None):
+        self.root_dir = root_dir or Config.RESULTS_STORE_DIR
+        self.flush_rows = flush_rows or Config.RESULTS_FLUSH_ROWS
+        self.flush_seconds = flush_seconds or Config.RESULTS_FLUSH_SECONDS
+        self._buffer = []
+        self._oldest_buffered = None
+        self._lock = threading.Lock()
+        os.makedirs(self.root_dir, exist_ok=True)
+        # Buffered rows must not be lost when the process exits
+        atexit.register(self.flush)
+
+    def append(self, result: Dict, recorded_at: Optional[datetime] = None):
+        row = self._flatten(result, recorded_at or datetime.now(timezone.utc))
+        with self._lock:
+            self._buffer.append(row)
+            if self._oldest_buffered is None:
+                self._oldest_buffered = time.monotonic()
+            due = (len(self._buffer) >= self.flush_rows or
+                   time.monotonic() - self._oldest_buffered >= self.flush_seconds)
+        if due:
+            self.flush()
+
+    def extend(self, results: List[Dict]):
+        for result in results:
+            self.append(result)
+
+    def flush(self) -> int:
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            self._oldest_buffered = None
+        if not rows:
+            return 0
+
+        # New files only; existing partitions are never rewritten on append
+        partitions = {}
+        for row in rows:
+            partitions.setdefault((row.pop('date'), row.pop('category')), []).append(row)
+        for (day, category), partition_rows in partitions.items():
+            table = pa.Table.from_pylist(partition_rows, schema=self.SCHEMA)
+            directory = self._partition_dir(day, category)
+            os.makedirs(directory, exist_ok=True)
+            pq.write_table(table, os.path.join(directory, f"part-{uuid.uuid4().hex}.parquet"))
+        return len(rows)
+
+    def scan(self, categories: Optional[List[str]] = None,
+             start_date: Optional[Union[str, date]] = None,
+             end_date: Optional[Union[str, date]] = None,
+             columns: Optional[List[str]] = None,
+             success: Optional[bool] = None):
+        """Loads only the matching partitions and columns into a pandas DataFrame"""
+        self.flush()
+
+        expression = None
+        conditions = []
+        if categories:
+            conditions.append(ds.field('category').isin(list(categories)))
+        if start_date:
+            conditions.append(ds.field('date') >= str(start_date))
+        if end_date:
+            conditions.append(ds.field('date') <= str(end_date))
+        if success is not None:
+            conditions.append(ds.field('success') == success)
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+
+        return self.dataset().to_table(columns=columns, filter=expression).to_pandas()
+
+    def dataset(self) -> ds.Dataset:
+        schema = pa.unify_schemas([self.SCHEMA, self.PARTITIONING.schema])
+        return ds.dataset(self.root_dir, format='parquet', schema=schema,
+                          partitioning=self.PARTITIONING)
+
+    def compact(self, min_files: int = 2) -> int:
+        """Merges each partition's small append files into one; returns partitions rewritten"""
+        self.flush()
+        compacted = 0
+        for directory, _, files in os.walk(self.root_dir):
+            parts = sorted(f for f in files if f.endswith('.parquet'))
+            if len(parts) < min_files:
+                continue
+            paths = [os.path.join(directory, f) for f in parts]
+            table = pa.concat_tables([pq.read_table(path, schema=self.SCHEMA) for path in paths])
+            pq.write_table(table, os.path.join(directory, f"part-{uuid.uuid4().hex}.parquet"))
+            for path in paths:
+                os.remove(path)
+            compacted += 1
+        return compacted
+
+    def _partition_dir(self, day: str, category: str) -> str:
+        return os.path.join(self.root_dir, f"date={day}", f"category={category}")
+
+    def _flatten(self, result: Dict, recorded_at: datetime) -> Dict:
+        classification = result.get('classification') or {}
+        mission = result.get('mission_statement') or {}
+        speculation = result.get('speculation') or {}
+        vision_analysis = result.get('vision_analysis')
+        severities = self._count_severities(vision_analysis or '')
+        action_steps = mission.get('action_steps') or []
+
+        return {
+            'date': recorded_at.astimezone(timezone.utc).date().isoformat(),
+            'category': classification.get('category') or 'Unknown',
+            'recorded_at': recorded_at,
+            'source': result.get('source'),
+            'success': bool(result.get('success')),
+            'failed_step': result.get('step'),
+            'image_path': result.get('image_path'),
+            'original_description': result.get('original_description'),
+            'confidence': classification.get('confidence'),
+            'classification_source': classification.get('source'),
+            'reasoning': classification.get('reasoning'),
+            'high_severity_count': severities['High'],
+            'medium_severity_count': severities['Medium'],
+            'low_severity_count': severities['Low'],
+            'max_severity': next((level for level in self.SEVERITIES if severities[level]), None),
+            'mission_statement': mission.get('mission_statement'),
+            'problem_definition': mission.get('problem_definition'),
+            'goal': mission.get('goal'),
+            'expected_impact': mission.get('expected_impact'),
+            'action_steps': action_steps,
+            'action_step_count': len(action_steps),
+            'speculation_hit': speculation.get('hit'),
+            'vision_analysis': vision_analysis
+        }
+
+    def _count_severities(self, vision_analysis: str) -> Dict[str, int]:
+        # Severities are only meaningful inside the DETECTED ISSUES section
+        section = vision_analysis.split('VISUAL EVIDENCE:')[0]
+        counts = {level: 0 for level in self.SEVERITIES}
+        for match in re.findall(r'(?:severity(?:\s+level)?\W{0,4}|\(\s*)(high|medium|low)\b',
+                                section, re.IGNORECASE):
+            counts[match.capitalize()] += 1
+        return counts
@@ -0,0 +1,195 @@
+import contextvars
+import hashlib
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+from config import Config
+from profiling import ProfileSession, active_session, profiled_call
+from result_cache import ResultCache
+
+
+class Stage:
+    """A named pipeline step and the inputs it reads"""
+
+    def __init__(self, name: str, func: Callable, inputs: Sequence[str] = (),
+                 cache: bool = True):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.cache = cache
+
+
+class StageGraph:
+    """Runs stages in dependency order, concurrently where independent, caching each output"""
+
+    def __init__(self, stages: List[Stage], executor: Optional[ThreadPoolExecutor] = None,
+                 cache: Optional[ResultCache] = None):
+        self.stages = self._order(stages)
+        self.stage_names = {stage.name for stage in self.stages}
+        self.inputs = {name for stage in self.stages for name in stage.inputs
+                       if name not in self.stage_names}
+        # Without a shared executor each run that has parallel stages starts its own pool
+        self.executor = executor
+        self.cache = cache if cache is not None else ResultCache(Config.STAGE_CACHE_SIZE)
+
+    def extend(self, stages: List[Stage]) -> 'StageGraph':
+        return StageGraph(self.stages + list(stages), self.executor, self.cache)
+
+    def run(self, profile_session: Optional[ProfileSession] = None, **inputs) -> Dict:
+        result = None
+        for event in self.iter_run(profile_session, **inputs):
+            if event['stage'] == 'complete':
+                result = event['data']
+        return result
+
+    def iter_run(self, profile_session: Optional[ProfileSession] = None,
+                 **inputs) -> Iterator[Dict]:
+        """Yields an event per finished stage, then a 'complete' event with all outputs
+
+        Successful outputs are cached by input hash, so running a failed graph again
+        with the same inputs resumes from the stage that failed. A stage with nothing
+        to overlap runs on the caller's thread; only stages that can run side by side
+        go to a thread pool. profile_session, when given, is made current only
+        while a stage runs, never across a yield.
+        """
+        missing = self.inputs - set(inputs)
+        if missing:
+            raise ValueError(f"Missing graph inputs: {', '.join(sorted(missing))}")
+
+        started = time.perf_counter()
+        outputs = {}
+        keys = {name: self._hash(value) for name, value in inputs.items()}
+        timings = {}
+        pending = list(self.stages)
+        running = {}
+        failed_stage, error = None, None
+        pool = self.executor
+
+        try:
+            while pending or running:
+                # Collect every stage whose inputs are ready, serving cached ones inline
+                ready = []
+                progressed = True
+                while progressed and failed_stage is None:
+                    progressed = False
+                    for stage in list(pending):
+                        if not all(name in inputs or name in outputs for name in stage.inputs):
+                            continue
+                        pending.remove(stage)
+                        progressed = True
+                        keys[stage.name] = self._stage_key(stage, keys)
+                        cached = self.cache.get(keys[stage.name]) if stage.cache else None
+                        if cached is not None:
+                            outputs[stage.name] = cached['output']
+                            timings[stage.name] = 0.0
+                            yield self._event(stage.name, cached['output'], cached=True)
+                        else:
+                            args = {name: inputs[name] if name in inputs else outputs[name]
+                                    for name in stage.inputs}
+                            ready.append((stage, args))
+
+                if len(ready) == 1 and not running:
+                    stage, args = ready[0]
+                    finished = [(stage, self._call(stage, args, profile_session))]
+                else:
+                    if ready and pool is None:
+                        # Per run, so concurrency is bounded by the callers and not a shared pool
+                        pool = ThreadPoolExecutor(max_workers=len(self.stages),
+                                                  thread_name_prefix='stage')
+                    for stage, args in ready:
+                        # Workers inherit the caller's context (e.g. an active profile session)
+                        context = contextvars.copy_context()
+                        running[pool.submit(context.run, self._call, stage, args,
+                                            profile_session)] = stage
+                    if not running:
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    finished = [(running.pop(future), future.result()) for future in done]
+
+                for stage, (output, stage_error, seconds) in finished:
+                    timings[stage.name] = seconds
+
+                    if stage_error is None and self._succeeded(output):
+                        outputs[stage.name] = output
+                        if stage.cache:
+                            self.cache.put(keys[stage.name], {'output': output})
+                        yield self._event(stage.name, output)
+                    else:
+                        if failed_stage is None:
+                            failed_stage = stage.name
+                            error = stage_error if stage_error is not None else \
+                                output.get('error', f"{stage.name} failed")
+                        yield self._event(stage.name, output or {'success': False, 'error': stage_error})
+        finally:
+            if pool is not None and pool is not self.executor:
+                # Stages are only still pending here when the consumer stopped iterating early
+                pool.shutdown(wait=False, cancel_futures=True)
+
+        yield {
+            'stage': 'complete',
+            'success': failed_stage is None,
+            'cached': False,
+            'data': {
+                'success': failed_stage is None,
+                'outputs': outputs,
+                'failed_stage': failed_stage,
+                'error': error,
+                'timings': timings,
+                'elapsed': time.perf_counter() - started
+            }
+        }
+
+    def _call(self, stage: Stage, args: Dict, profile_session: Optional[ProfileSession] = None):
+        started = time.perf_counter()
+        try:
+            with active_session(profile_session):
+                output = profiled_call(stage.func, **args)
+            return output, None, time.perf_counter() - started
+        except Exception as e:
+            return None, str(e), time.perf_counter() - started
+
+    def _succeeded(self, output) -> bool:
+        # Stage outputs are dicts or dict-compatible result objects
+        return not (hasattr(output, 'get') and output.get('success') is False)
+
+    def _event(self, stage: str, output, cached: bool = False) -> Dict:
+        return {
+            'stage': stage,
+            'success': self._succeeded(output),
+            'cached': cached,
+            'data': output
+        }
+
+    def _stage_key(self, stage: Stage, keys: Dict[str, str]) -> str:
+        # Chain upstream keys so a stage's key changes whenever any ancestor's input does
+        material = stage.name + '|' + '|'.join(f"{name}={keys[name]}" for name in stage.inputs)
+        return ResultCache.make_key(material.encode(), stage.name)
+
+    def _hash(self, value) -> str:
+        material = json.dumps(value, sort_keys=True, default=repr)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _order(self, stages: List[Stage]) -> List[Stage]:
+        by_name = {stage.name: stage for stage in stages}
+        if len(by_name) != len(stages):
+            raise ValueError("Stage names must be unique")
+
+        ordered, visiting, visited = [], set(), set()
+
+        def visit(stage: Stage):
+            if stage.name in visited:
+                return
+            if stage.name in visiting:
+                raise ValueError(f"Stage graph has a cycle through '{stage.name}'")
+            visiting.add(stage.name)
+            for name in stage.inputs:
+                if name in by_name:
+                    visit(by_name[name])
+            visiting.discard(stage.name)
+            visited.add(stage.name)
+            ordered.append(stage)
+
+        for stage in stages:
+            visit(stage)
+        return ordered
@@ -1,8 +1,14 @@
 import base64
+import io
 import os
+import re
 from typing import Dict, List, Optional
 import google.generativeai as genai
 from config import Config
+from image_quality import assess_image_quality, describe_quality_issues
+from metrics import metrics
+from model_client import ModelClient
+from result_types import VisionResult
 
 
 class CommunityIssueDetector:
@@ -11,44 +17,207 @@ class CommunityIssueDetector:
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key or Config.GEMINI_API_KEY
         genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel(Config.VISION_MODEL)
+        self.model = ModelClient(Config.VISION_MODEL, stage='vision')
         
     def encode_image(self, image_path: str) -> str:
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode('utf-8')
     
-    def detect_issues(self, image_path: str, domains: Optional[List[str]] = None) -> Dict:
+    def detect_issues(self, image_path: str, domains: Optional[List[str]] = None,
+                      keep_raw_response: bool = False) -> VisionResult:
         domains = domains or Config.CATEGORIES
         
-        # Create the prompt
-        prompt = self._create_detection_prompt(domains)
-        
         try:
-            # Read and prepare the image
+            # Read and prepare the image; the handle is released as soon as the call returns
             from PIL import Image
-            img = Image.open(image_path)
-            
-            # Call Gemini Vision API
-            response = self.model.generate_content([prompt, img])
+            with Image.open(image_path) as img:
+                quality = self.check_quality(img) if Config.QUALITY_GATE != 'off' else None
+                if quality and not quality['usable'] and Config.QUALITY_GATE == 'reject':
+                    return self._rejected(quality, domains)
+                
+                if getattr(img, 'is_animated', False):
+                    result = self._analyze_animation(img, domains, keep_raw_response)
+                else:
+                    result = self._analyze_image(img, domains, keep_raw_response)
+                if quality and not quality['usable']:
+                    result['quality'] = quality
+                return result
             
-            # Parse the response
-            analysis = response.text
+        except Exception as e:
+            return VisionResult(
+                success=False,
+                error=str(e),
+                domains_analyzed=domains
+            )
+    
+    def detect_issues_from_bytes(self, image_bytes: bytes, mime_type: str = 'image/jpeg',
+                                 domains: Optional[List[str]] = None,
+                                 keep_raw_response: bool = False,
+                                 quality: Optional[Dict] = None) -> VisionResult:
+        domains = domains or Config.CATEGORIES
+        
+        try:
+            if Config.QUALITY_GATE != 'off':
+                # Batch workers assess while decoding; their metrics stay in the worker process
+                quality = self._count_quality(quality) if quality else self._check_bytes_quality(image_bytes)
+                if not quality['usable'] and Config.QUALITY_GATE == 'reject':
+                    return self._rejected(quality, domains)
             
-            return {
-                'success': True,
-                'analysis': analysis,
-                'raw_response': response,
-                'domains_analyzed': domains
-            }
+            # Already-encoded images go to the API as-is, with no PIL round trip
+            image_part = {'mime_type': mime_type, 'data': image_bytes}
+            result = self._analyze_image(image_part, domains, keep_raw_response)
+            if quality and not quality['usable']:
+                result['quality'] = quality
+            return result
             
         except Exception as e:
-            return {
-                'success': False,
-                'error': str(e),
-                'domains_analyzed': domains
-            }
+            return VisionResult(
+                success=False,
+                error=str(e),
+                domains_analyzed=domains
+            )
+    
+    def check_quality(self, img, original_size: Optional[tuple] = None) -> Dict:
+        """Runs the local quality checks and counts every failed one in metrics"""
+        return self._count_quality(assess_image_quality(img, original_size))
+    
+    def _count_quality(self, quality: Dict) -> Dict:
+        for issue in quality['issues']:
+            metrics.increment(f"quality_gate.{issue}")
+        if not quality['usable']:
+            metrics.increment('quality_gate.rejected' if Config.QUALITY_GATE == 'reject'
+                              else 'quality_gate.flagged')
+        return quality
+    
+    def _check_bytes_quality(self, image_bytes: bytes) -> Dict:
+        from PIL import Image
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            original_size = img.size
+            # JPEG can decode straight to a small grayscale image, which is all the checks need
+            img.draft('L', (Config.QUALITY_SAMPLE_SIDE, Config.QUALITY_SAMPLE_SIDE))
+            return self.check_quality(img, original_size)
+    
+    def _rejected(self, quality: Dict, domains: List[str]) -> VisionResult:
+        return VisionResult(
+            success=False,
+            error=f"Image rejected before analysis: {describe_quality_issues(quality)}",
+            domains_analyzed=domains,
+            quality=quality
+        )
+    
+    def _analyze_image(self, image, domains: List[str],
+                       keep_raw_response: bool) -> VisionResult:
+        # Create the prompt
+        prompt = self._create_detection_prompt(domains)
+        
+        # Call Gemini Vision API
+        response = self.model.generate_content([prompt, image])
+        
+        # Parse the response
+        analysis = response.text
+        
+        return VisionResult(
+            success=True,
+            analysis=analysis,
+            domains_analyzed=domains,
+            raw_response=response if keep_raw_response else None
+        )
+    
+    def _analyze_animation(self, img, domains: List[str], keep_raw_response: bool,
+                           packed: Optional[bool] = None) -> VisionResult:
+        keyframes = self.select_keyframes(img)
+        frame_indexes = [index for index, _ in keyframes]
+        if packed is None:
+            packed = Config.KEYFRAME_PACKED
+        
+        if len(keyframes) == 1:
+            result = self._analyze_image(keyframes[0][1], domains, keep_raw_response)
+        elif packed:
+            # One request sees every keyframe and answers for the whole animation
+            prompt = self._create_detection_prompt(domains, image_count=len(keyframes),
+                                                   keyframes=True)
+            contents = [prompt]
+            for i, (_, frame) in enumerate(keyframes, 1):
+                contents.extend([f"Keyframe {i}:", frame])
+            response = self.model.generate_content(contents)
+            result = VisionResult(
+                success=True,
+                analysis=response.text,
+                domains_analyzed=domains,
+                raw_response=response if keep_raw_response else None
+            )
+        else:
+            analyses = [self._analyze_image(frame, domains, False)['analysis']
+                        for _, frame in keyframes]
+            result = VisionResult(
+                success=True,
+                analysis=self._merge_frame_analyses(analyses, frame_indexes),
+                domains_analyzed=domains
+            )
+        
+        result['frames_analyzed'] = frame_indexes
+        result['frame_count'] = img.n_frames
+        return result
+    
+    def select_keyframes(self, img, max_keyframes: Optional[int] = None) -> List[tuple]:
+        """Picks scene-change frames from an animated image as (frame index, RGB frame) pairs"""
+        import numpy as np
+        from PIL import ImageSequence
+        
+        max_keyframes = max_keyframes or Config.KEYFRAME_MAX
+        sample_size = (Config.KEYFRAME_SAMPLE_SIZE, Config.KEYFRAME_SAMPLE_SIZE)
+        
+        keyframes = []
+        reference = None
+        # Frames are decoded one at a time; only keyframes are kept in full
+        for index, frame in enumerate(ImageSequence.Iterator(img)):
+            pixels = np.asarray(frame.convert('L').resize(sample_size), dtype=np.float32)
+            histogram = np.histogram(pixels, bins=32, range=(0, 256))[0] / pixels.size
+            
+            if reference is None:
+                score = float('inf')
+            else:
+                histogram_change = 0.5 * np.abs(histogram - reference[1]).sum()
+                pixel_change = np.abs(pixels - reference[0]).mean() / 255
+                if (histogram_change < Config.KEYFRAME_HISTOGRAM_THRESHOLD and
+                        pixel_change < Config.KEYFRAME_PIXEL_THRESHOLD):
+                    continue
+                score = max(histogram_change, pixel_change)
+            
+            reference = (pixels, histogram)
+            keyframes.append((index, frame.convert('RGB'), score))
+            if len(keyframes) > max_keyframes:
+                # Drop the weakest scene change; the first frame always stays
+                weakest = min(range(1, len(keyframes)), key=lambda i: keyframes[i][2])
+                del keyframes[weakest]
+        
+        return [(index, frame) for index, frame, _ in keyframes]
+    
+    def _merge_frame_analyses(self, analyses: List[str], frame_indexes: List[int]) -> str:
+        headers = ['DETECTED ISSUES:', 'VISUAL EVIDENCE:', 'RECOMMENDATIONS:']
+        merged = {header: [] for header in headers}
+        
+        for analysis, frame_index in zip(analyses, frame_indexes):
+            for i, header in enumerate(headers):
+                start = analysis.find(header)
+                if start == -1:
+                    continue
+                start += len(header)
+                end = min([analysis.find(h, start) for h in headers[i + 1:]
+                           if analysis.find(h, start) != -1] or [len(analysis)])
+                for line in analysis[start:end].strip().split('\n'):
+                    line = line.strip()
+                    # Issues that persist across frames are reported once
+                    if line and line not in merged[header]:
+                        merged[header].append(line)
+        
+        if not any(merged.values()):
+            return '\n\n'.join(f"Frame {index}:\n{analysis}"
+                               for analysis, index in zip(analyses, frame_indexes))
+        return '\n\n'.join(f"{header}\n" + '\n'.join(lines) for header, lines in merged.items())
     
-    def _create_detection_prompt(self, domains: List[str]) -> str:
+    def _create_detection_prompt(self, domains: List[str], image_count: int = 1,
+                                 keyframes: bool = False) -> str:
         domain_examples = []
         for domain in domains:
             if domain in Config.DOMAIN_ISSUES:
@@ -57,9 +226,23 @@ class CommunityIssueDetector:
         
         examples_text = '\n'.join(domain_examples)
         
+        if image_count == 1:
+            task = "Analyze this image and identify any visible community problems"
+            format_intro = "Format your response as:"
+        elif keyframes:
+            task = (f"You will receive {image_count} keyframes, in order, from one animated image. "
+                    f"Treat them as a single scene and identify any visible community problems")
+            format_intro = "Give one combined analysis for the whole animation, formatted as:"
+        else:
+            task = (f"You will receive {image_count} images, each preceded by a label from "
+                    f"\"Image 1\" to \"Image {image_count}\". Analyze each image independently "
+                    f"and identify any visible community problems")
+            format_intro = ("For each image, start a new section with the line "
+                            "=== IMAGE <number> === and format that section as:")
+        
         prompt = f"""You are an AI assistant specialized in identifying community issues in images.
 
-Analyze this image and identify any visible community problems in the following domains:
+{task} in the following domains:
 {', '.join(domains)}
 
 For each domain, look for issues such as:
@@ -72,7 +255,7 @@ Please provide:
 4. The severity level (Low, Medium, High)
 5. Specific visual evidence you observed
 
-Format your response as:
+{format_intro}
 
 DETECTED ISSUES:
 [List each issue with its domain, description, and severity]
@@ -88,17 +271,154 @@ Be specific and objective in your analysis."""
         return prompt
     
     def detect_multiple_images(self, image_paths: List[str], 
-                              domains: Optional[List[str]] = None) -> List[Dict]:
+                              domains: Optional[List[str]] = None,
+                              packed: bool = False) -> List[VisionResult]:
+        if packed:
+            return self.detect_multiple_images_packed(image_paths, domains)
+        
         results = []
         for image_path in image_paths:
             result = self.detect_issues(image_path, domains)
             result['image_path'] = image_path
             results.append(result)
         return results
+    
+    def detect_multiple_images_packed(self, image_paths: List[str],
+                                      domains: Optional[List[str]] = None,
+                                      token_budget: Optional[int] = None,
+                                      max_images: Optional[int] = None) -> List[VisionResult]:
+        domains = domains or Config.CATEGORIES
+        
+        results = []
+        for chunk in self._chunk_by_token_budget(image_paths, token_budget, max_images):
+            results.extend(self._detect_packed_chunk(chunk, domains))
+        return results
+    
+    def _detect_packed_chunk(self, image_paths: List[str], domains: List[str]) -> List[VisionResult]:
+        # A chunk of one gains nothing from packing
+        if len(image_paths) == 1:
+            return self.detect_multiple_images(image_paths, domains)
+        
+        from PIL import Image
+        results, images, qualities = {}, {}, {}
+        try:
+            for image_path in image_paths:
+                try:
+                    images[image_path] = Image.open(image_path)
+                except Exception as e:
+                    results[image_path] = VisionResult(success=False, error=str(e),
+                                                       domains_analyzed=domains)
+                    continue
+                # Same gate as detect_issues, so packing never sends an image it would reject
+                if Config.QUALITY_GATE == 'off':
+                    continue
+                quality = self.check_quality(images[image_path])
+                if not quality['usable']:
+                    qualities[image_path] = quality
+                    if Config.QUALITY_GATE == 'reject':
+                        results[image_path] = self._rejected(quality, domains)
+            
+            packable = [image_path for image_path in images if image_path not in results]
+            if len(packable) == 1:
+                results[packable[0]] = self._analyze_single(images[packable[0]], domains)
+            elif packable:
+                results.update(self._analyze_packed(packable, images, domains))
+        
+        finally:
+            for img in images.values():
+                img.close()
+        
+        ordered = []
+        for image_path in image_paths:
+            result = results[image_path]
+            result['image_path'] = image_path
+            if image_path in qualities:
+                result['quality'] = qualities[image_path]
+            ordered.append(result)
+        return ordered
+    
+    def _analyze_packed(self, image_paths: List[str], images: Dict,
+                        domains: List[str]) -> Dict[str, VisionResult]:
+        prompt = self._create_detection_prompt(domains, image_count=len(image_paths))
+        contents = [prompt]
+        for i, image_path in enumerate(image_paths, 1):
+            contents.extend([f"Image {i}:", images[image_path]])
+        
+        try:
+            response = self.model.generate_content(contents)
+            sections = self._split_packed_response(response.text)
+        except Exception as e:
+            return {image_path: VisionResult(success=False, error=str(e), domains_analyzed=domains)
+                    for image_path in image_paths}
+        
+        results = {}
+        for i, image_path in enumerate(image_paths, 1):
+            if i in sections:
+                results[image_path] = VisionResult(
+                    success=True,
+                    analysis=sections[i],
+                    domains_analyzed=domains,
+                    packed=True
+                )
+            else:
+                # The model skipped this image; analyze it on its own
+                results[image_path] = self._analyze_single(images[image_path], domains)
+        return results
+    
+    def _analyze_single(self, img, domains: List[str]) -> VisionResult:
+        try:
+            return self._analyze_image(img, domains, keep_raw_response=False)
+        except Exception as e:
+            return VisionResult(success=False, error=str(e), domains_analyzed=domains)
+    
+    def _split_packed_response(self, response_text: str) -> Dict[int, str]:
+        sections = {}
+        markers = list(re.finditer(r'^\W*IMAGE\s+(\d+)\W*$', response_text,
+                                   re.IGNORECASE | re.MULTILINE))
+        for i, marker in enumerate(markers):
+            end = markers[i + 1].start() if i + 1 < len(markers) else len(response_text)
+            section = response_text[marker.end():end].strip()
+            if section:
+                sections[int(marker.group(1))] = section
+        return sections
+    
+    def _chunk_by_token_budget(self, image_paths: List[str],
+                               token_budget: Optional[int] = None,
+                               max_images: Optional[int] = None) -> List[List[str]]:
+        token_budget = token_budget or Config.PACKED_TOKEN_BUDGET
+        max_images = max_images or Config.PACKED_MAX_IMAGES
+        
+        chunks = []
+        current, current_tokens = [], 0
+        for image_path in image_paths:
+            tokens = self._estimate_image_tokens(image_path)
+            if current and (current_tokens + tokens > token_budget or 
+                            len(current) >= max_images):
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(image_path)
+            current_tokens += tokens
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    def _estimate_image_tokens(self, image_path: str) -> int:
+        # Gemini bills small images as one tile and tiles larger ones at 768x768
+        from PIL import Image
+        try:
+            with Image.open(image_path) as img:
+                width, height = img.size
+        except Exception:
+            return Config.IMAGE_TILE_TOKENS
+        
+        if width <= 384 and height <= 384:
+            return Config.IMAGE_TILE_TOKENS
+        tiles = -(-width // 768) * -(-height // 768)
+        return tiles * Config.IMAGE_TILE_TOKENS
 
 
 # Convenience function
 def detect_community_issue(image_path: str, 
-                          domains: Optional[List[str]] = None) -> Dict:
+                          domains: Optional[List[str]] = None) -> VisionResult:
     detector = CommunityIssueDetector()
     return detector.detect_issues(image_path, domains)